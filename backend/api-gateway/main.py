@@ -1,8 +1,19 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 import os
-from typing import List
+import json
+import time
+import base64
+import hashlib
+import asyncio
+from typing import List, Optional
+
+from auth import decode_token, sign_identity, IDENTITY_HEADER
+from cache import TTLCache, etag_matches
+from singleflight import SingleFlight
 
 app = FastAPI(title="Task Manager API Gateway")
 
@@ -13,6 +24,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Service URLs
@@ -20,19 +32,283 @@ TASKS_SERVICE_URL = os.getenv("TASKS_SERVICE_URL", "http://localhost:8001")
 USERS_SERVICE_URL = os.getenv("USERS_SERVICE_URL", "http://localhost:8002")
 NOTIFICATIONS_SERVICE_URL = os.getenv("NOTIFICATIONS_SERVICE_URL", "http://localhost:8003")
 
-async def forward_request(service_url: str, path: str, method: str = "GET", json_data=None, headers=None):
-    async with httpx.AsyncClient() as client:
+# Pool de conexões compartilhado por serviço (keep-alive entre o gateway e os serviços)
+GATEWAY_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+GATEWAY_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GATEWAY_MAX_KEEPALIVE_CONNECTIONS", "20"))
+GATEWAY_KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_KEEPALIVE_EXPIRY", "30"))
+GATEWAY_CONNECT_TIMEOUT = float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "5"))
+
+# Streams SSE ficam abertos indefinidamente, então usam um pool próprio (um por usuário
+# conectado) e não consomem as conexões das rotas de requisição/resposta. Com o pool de
+# streams cheio, novos streams recebem 503 após GATEWAY_STREAM_POOL_TIMEOUT segundos
+GATEWAY_STREAM_MAX_CONNECTIONS = int(os.getenv("GATEWAY_STREAM_MAX_CONNECTIONS", "1000"))
+GATEWAY_STREAM_POOL_TIMEOUT = float(os.getenv("GATEWAY_STREAM_POOL_TIMEOUT", "5"))
+
+# Timeouts por rota (segundos); login e registro são mais lentos por causa do bcrypt
+AUTH_TIMEOUT = float(os.getenv("GATEWAY_AUTH_TIMEOUT", "15"))
+READ_TIMEOUT = float(os.getenv("GATEWAY_READ_TIMEOUT", "10"))
+WRITE_TIMEOUT = float(os.getenv("GATEWAY_WRITE_TIMEOUT", "10"))
+BULK_TIMEOUT = float(os.getenv("GATEWAY_BULK_TIMEOUT", "60"))
+
+# Modo streaming: repassa status, cabeçalhos e bytes do corpo sem decodificar o JSON
+GATEWAY_STREAMING = os.getenv("GATEWAY_STREAMING", "true").lower() == "true"
+
+# Cabeçalhos hop-by-hop (e os que o próprio uvicorn gera) não devem ser repassados pelo proxy
+EXCLUDED_RESPONSE_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "date", "server"
+}
+
+# Verifica o JWT uma única vez no gateway e repassa uma identidade assinada aos serviços
+GATEWAY_IDENTITY_HEADER = os.getenv("GATEWAY_IDENTITY_HEADER", "false").lower() == "true"
+
+# Cache de respostas GET do gateway (diretório de usuários): em memória, limitado por
+# tamanho e TTL, com persistência opcional em disco para sobreviver a reinícios
+GATEWAY_CACHE_SIZE = int(os.getenv("GATEWAY_CACHE_SIZE", "256"))
+GATEWAY_CACHE_TTL = float(os.getenv("GATEWAY_CACHE_TTL", "60"))
+GATEWAY_CACHE_DIR = os.getenv("GATEWAY_CACHE_DIR", "")
+
+USERS_CACHE_KEY = "GET /users"
+
+clients = {}
+stream_client = None
+response_cache = TTLCache(maxsize=GATEWAY_CACHE_SIZE, ttl=GATEWAY_CACHE_TTL)
+# Geração de cada chave do cache, incrementada a cada invalidação: uma busca que começou
+# antes dela não grava nem compartilha sua resposta com quem chegou depois
+response_generations = {}
+# GETs idênticos simultâneos compartilham uma única chamada ao serviço
+upstream_flight = SingleFlight()
+
+@app.on_event("startup")
+async def create_clients():
+    global stream_client
+    limits = httpx.Limits(
+        max_connections=GATEWAY_MAX_CONNECTIONS,
+        max_keepalive_connections=GATEWAY_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=GATEWAY_KEEPALIVE_EXPIRY
+    )
+    for service_url in (TASKS_SERVICE_URL, USERS_SERVICE_URL, NOTIFICATIONS_SERVICE_URL):
+        clients[service_url] = httpx.AsyncClient(
+            base_url=service_url,
+            limits=limits,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=GATEWAY_CONNECT_TIMEOUT)
+        )
+    stream_client = httpx.AsyncClient(
+        base_url=NOTIFICATIONS_SERVICE_URL,
+        limits=httpx.Limits(max_connections=GATEWAY_STREAM_MAX_CONNECTIONS, max_keepalive_connections=0)
+    )
+
+@app.on_event("shutdown")
+async def close_clients():
+    for client in clients.values():
+        await client.aclose()
+    clients.clear()
+    await stream_client.aclose()
+
+async def forward_request(service_url: str, path: str, method: str = "GET", json_data=None, headers=None, timeout: float = READ_TIMEOUT, params=None):
+    if method == "GET":
+        # A chave inclui os cabeçalhos (Authorization), então só coalesce chamadas do mesmo usuário
+        key = (service_url, path, str(httpx.QueryParams(params)), tuple(sorted((headers or {}).items())))
+        return await upstream_flight.do(key, send_request, service_url, path, method, json_data, headers, timeout, params)
+    return await send_request(service_url, path, method, json_data, headers, timeout, params)
+
+async def send_request(service_url: str, path: str, method: str, json_data, headers, timeout: float, params):
+    client = clients[service_url]
+    try:
+        response = await client.request(
+            method=method,
+            url=path,
+            json=json_data,
+            headers=headers,
+            params=params,
+            timeout=httpx.Timeout(timeout, connect=GATEWAY_CONNECT_TIMEOUT)
+        )
+        return response
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+
+def auth_headers(authorization: Optional[str]):
+    if not authorization:
+        return None
+
+    headers = {"Authorization": authorization}
+    if GATEWAY_IDENTITY_HEADER:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() == "bearer" and token:
+            headers[IDENTITY_HEADER] = sign_identity(decode_token(token))
+    return headers
+
+def upstream_error(response: httpx.Response) -> HTTPException:
+    try:
+        detail = response.json()
+    except ValueError:
+        detail = response.text
+    return HTTPException(status_code=response.status_code, detail=detail)
+
+def proxied_headers(response: httpx.Response) -> dict:
+    return {
+        name: value for name, value in response.headers.items()
+        if name.lower() not in EXCLUDED_RESPONSE_HEADERS
+    }
+
+async def stream_request(service_url: str, path: str, method: str = "GET", headers=None, timeout: Optional[float] = READ_TIMEOUT, params=None, client: Optional[httpx.AsyncClient] = None, pool_timeout: Optional[float] = None):
+    client = client or clients[service_url]
+    request = client.build_request(
+        method=method,
+        url=path,
+        headers=headers,
+        params=params,
+        timeout=httpx.Timeout(timeout, connect=GATEWAY_CONNECT_TIMEOUT, pool=pool_timeout if pool_timeout is not None else timeout)
+    )
+    try:
+        response = await client.send(request, stream=True)
+    except httpx.PoolTimeout:
+        raise HTTPException(status_code=503, detail="Too many open streams")
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+
+    if response.status_code == 304:
+        await response.aclose()
+        return Response(status_code=304, headers=proxied_headers(response))
+
+    if response.status_code != 200:
+        await response.aread()
+        await response.aclose()
+        raise upstream_error(response)
+
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers=proxied_headers(response),
+        background=BackgroundTask(response.aclose)
+    )
+
+def conditional_headers(request: Request, authorization: Optional[str]):
+    # Cabeçalhos de autenticação mais o If-None-Match do cliente, para que os serviços
+    # possam responder 304 Not Modified
+    headers = auth_headers(authorization) or {}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        headers["If-None-Match"] = if_none_match
+    return headers or None
+
+def cache_file(key: str) -> str:
+    return os.path.join(GATEWAY_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+def read_cache_file(key: str):
+    try:
+        with open(cache_file(key)) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None, 0
+
+    return (base64.b64decode(stored["content"]), stored["headers"]), stored["expires_at"] - time.time()
+
+def write_cache_file(key: str, entry):
+    content, headers = entry
+    os.makedirs(GATEWAY_CACHE_DIR, exist_ok=True)
+    path = cache_file(key)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({
+            "content": base64.b64encode(content).decode(),
+            "headers": headers,
+            "expires_at": time.time() + GATEWAY_CACHE_TTL
+        }, f)
+    os.replace(temp_path, path)
+
+def remove_cache_file(key: str):
+    try:
+        os.remove(cache_file(key))
+    except FileNotFoundError:
+        pass
+
+async def load_cached_response(key: str):
+    entry = response_cache.get(key)
+    if entry is not None or not GATEWAY_CACHE_DIR:
+        return entry
+
+    entry, remaining_ttl = await asyncio.to_thread(read_cache_file, key)
+    if entry is None or remaining_ttl <= 0:
+        return None
+
+    response_cache.set(key, entry, ttl=remaining_ttl)
+    return entry
+
+async def store_cached_response(key: str, entry):
+    response_cache.set(key, entry)
+    if GATEWAY_CACHE_DIR:
         try:
-            response = await client.request(
-                method=method,
-                url=f"{service_url}{path}",
-                json=json_data,
-                headers=headers,
-                timeout=30.0
-            )
-            return response
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+            await asyncio.to_thread(write_cache_file, key, entry)
+        except OSError:
+            pass  # o disco é só um complemento; a memória continua valendo
+
+async def drop_cached_response(key: str):
+    response_cache.invalidate(key)
+    if GATEWAY_CACHE_DIR:
+        await asyncio.to_thread(remove_cache_file, key)
+
+async def invalidate_cached_response(key: str):
+    response_generations[key] = response_generations.get(key, 0) + 1
+    await drop_cached_response(key)
+
+async def fill_cached_response(key: str, generation: int, service_url: str, path: str, authorization: str):
+    response = await send_request(service_url, path, "GET", None, auth_headers(authorization), READ_TIMEOUT, None)
+    if response.status_code != 200:
+        raise upstream_error(response)
+
+    response_headers = proxied_headers(response)
+    response_headers.pop("content-length", None)
+    response_headers.pop("content-encoding", None)
+    entry = (response.content, response_headers)
+    if response_generations.get(key, 0) == generation:
+        await store_cached_response(key, entry)
+        # A invalidação pode ter rodado durante a gravação em disco e terminado antes dela
+        if response_generations.get(key, 0) != generation:
+            await drop_cached_response(key)
+    return entry
+
+async def cached_get(key: str, service_url: str, path: str, request: Request, authorization: Optional[str]):
+    scheme, _, token = (authorization or "").partition(" ")
+    if GATEWAY_CACHE_TTL <= 0 or scheme.lower() != "bearer" or not token:
+        # Sem token válido o serviço decide a resposta de erro
+        return await proxy_get(service_url, path, conditional_headers(request, authorization))
+
+    # O token é verificado mesmo quando a resposta sai do cache
+    decode_token(token)
+
+    entry = await load_cached_response(key)
+    if entry is None:
+        # A resposta não depende do usuário: todas as falhas de cache simultâneas esperam
+        # a mesma busca, independente do token, desde que da mesma geração
+        generation = response_generations.get(key, 0)
+        entry = await upstream_flight.do(
+            ("cache", key, generation), fill_cached_response, key, generation, service_url, path, authorization
+        )
+
+    content, response_headers = entry
+    etag = response_headers.get("etag")
+    if etag and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"etag": etag})
+    return Response(content=content, status_code=200, headers=response_headers)
+
+async def proxy_get(service_url: str, path: str, headers=None, timeout: float = READ_TIMEOUT, params=None):
+    if GATEWAY_STREAMING:
+        return await stream_request(service_url, path, "GET", headers, timeout, params)
+
+    # Modo bufferizado: lê o corpo inteiro, mas ainda repassa os bytes e cabeçalhos sem decodificar
+    response = await forward_request(service_url, path, "GET", headers=headers, timeout=timeout, params=params)
+    if response.status_code == 304:
+        return Response(status_code=304, headers=proxied_headers(response))
+
+    if response.status_code != 200:
+        raise upstream_error(response)
+
+    # response.content já vem decodificado, então tamanho e codificação são recalculados
+    response_headers = proxied_headers(response)
+    response_headers.pop("content-length", None)
+    response_headers.pop("content-encoding", None)
+    return Response(content=response.content, status_code=response.status_code, headers=response_headers)
 
 # Health check
 @app.get("/health")
@@ -42,72 +318,113 @@ async def health_check():
 # User routes
 @app.post("/api/users/register")
 async def register_user(user_data: dict):
-    response = await forward_request(USERS_SERVICE_URL, "/users/register", "POST", user_data)
+    response = await forward_request(USERS_SERVICE_URL, "/users/register", "POST", user_data, timeout=AUTH_TIMEOUT)
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.json())
+
+    await invalidate_cached_response(USERS_CACHE_KEY)
     return response.json()
 
 @app.post("/api/users/login")
 async def login_user(login_data: dict):
-    response = await forward_request(USERS_SERVICE_URL, "/users/login", "POST", login_data)
+    response = await forward_request(USERS_SERVICE_URL, "/users/login", "POST", login_data, timeout=AUTH_TIMEOUT)
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.json())
     return response.json()
 
 @app.get("/api/users")
-async def get_users(authorization: str = Header(None)):
-    headers = {"Authorization": authorization} if authorization else None
-    response = await forward_request(USERS_SERVICE_URL, "/users", "GET", headers=headers)
-    if response.status_code != 200:
-        raise HTTPException(status_code=response.status_code, detail=response.json())
-    return response.json()
+async def get_users(request: Request, authorization: str = Header(None)):
+    # O diretório de usuários é lido muito mais do que escrito
+    return await cached_get(USERS_CACHE_KEY, USERS_SERVICE_URL, "/users", request, authorization)
 
 # Task routes
 @app.get("/api/tasks")
-async def get_tasks(authorization: str = Header(...)):
-    headers = {"Authorization": authorization} if authorization else None
-    response = await forward_request(TASKS_SERVICE_URL, "/tasks", "GET", headers=headers)
+async def get_tasks(request: Request, authorization: str = Header(...)):
+    headers = conditional_headers(request, authorization)
+    return await proxy_get(TASKS_SERVICE_URL, "/tasks", headers, params=request.query_params)
+
+@app.get("/api/tasks/stats")
+async def get_task_stats(authorization: str = Header(None)):
+    headers = auth_headers(authorization)
+    return await proxy_get(TASKS_SERVICE_URL, "/tasks/stats", headers)
+
+@app.get("/api/tasks/search")
+async def search_tasks(request: Request, authorization: str = Header(None)):
+    headers = conditional_headers(request, authorization)
+    return await proxy_get(TASKS_SERVICE_URL, "/tasks/search", headers, params=request.query_params)
+
+@app.post("/api/tasks")
+async def create_task(task_data: dict, authorization: str = Header(None)):
+    headers = auth_headers(authorization)
+    response = await forward_request(TASKS_SERVICE_URL, "/tasks", "POST", task_data, headers, timeout=WRITE_TIMEOUT)
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.json())
     return response.json()
 
-@app.post("/api/tasks")
-async def create_task(task_data: dict, authorization: str = Header(None)):
-    headers = {"Authorization": authorization} if authorization else None
-    response = await forward_request(TASKS_SERVICE_URL, "/tasks", "POST", task_data, headers)
+@app.post("/api/tasks/bulk")
+async def bulk_tasks(bulk_data: dict, authorization: str = Header(None)):
+    headers = auth_headers(authorization)
+    response = await forward_request(TASKS_SERVICE_URL, "/tasks/bulk", "POST", bulk_data, headers, timeout=BULK_TIMEOUT)
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.json())
     return response.json()
 
 @app.put("/api/tasks/{task_id}")
 async def update_task(task_id: int, task_data: dict, authorization: str = Header(None)):
-    headers = {"Authorization": authorization} if authorization else None
-    response = await forward_request(TASKS_SERVICE_URL, f"/tasks/{task_id}", "PUT", task_data, headers)
+    headers = auth_headers(authorization)
+    response = await forward_request(TASKS_SERVICE_URL, f"/tasks/{task_id}", "PUT", task_data, headers, timeout=WRITE_TIMEOUT)
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.json())
     return response.json()
 
 @app.delete("/api/tasks/{task_id}")
 async def delete_task(task_id: int, authorization: str = Header(None)):
-    headers = {"Authorization": authorization} if authorization else None
-    response = await forward_request(TASKS_SERVICE_URL, f"/tasks/{task_id}", "DELETE", headers=headers)
+    headers = auth_headers(authorization)
+    response = await forward_request(TASKS_SERVICE_URL, f"/tasks/{task_id}", "DELETE", headers=headers, timeout=WRITE_TIMEOUT)
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.json())
     return response.json()
 
 # Notification routes
 @app.get("/api/notifications")
-async def get_notifications(authorization: str = Header(None)):
-    headers = {"Authorization": authorization} if authorization else None
-    response = await forward_request(NOTIFICATIONS_SERVICE_URL, "/notifications", "GET", headers=headers)
+async def get_notifications(request: Request, authorization: str = Header(None)):
+    headers = conditional_headers(request, authorization)
+    return await proxy_get(NOTIFICATIONS_SERVICE_URL, "/notifications", headers, params=request.query_params)
+
+@app.get("/api/notifications/unread-count")
+async def get_unread_count(authorization: str = Header(None)):
+    headers = auth_headers(authorization)
+    return await proxy_get(NOTIFICATIONS_SERVICE_URL, "/notifications/unread-count", headers)
+
+@app.post("/api/notifications/stream-ticket")
+async def create_stream_ticket(authorization: str = Header(None)):
+    headers = auth_headers(authorization)
+    response = await forward_request(NOTIFICATIONS_SERVICE_URL, "/notifications/stream-ticket", "POST", headers=headers, timeout=WRITE_TIMEOUT)
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.json())
+    return response.json()
+
+@app.get("/api/notifications/stream")
+async def stream_notifications(request: Request):
+    # Conexão de longa duração: sem timeout de leitura, sempre em streaming e no pool
+    # dedicado aos streams
+    return await stream_request(
+        NOTIFICATIONS_SERVICE_URL, "/notifications/stream", "GET", timeout=None, params=request.query_params,
+        client=stream_client, pool_timeout=GATEWAY_STREAM_POOL_TIMEOUT
+    )
+
+@app.put("/api/notifications/read")
+async def mark_notifications_read(read_data: dict, authorization: str = Header(None)):
+    headers = auth_headers(authorization)
+    response = await forward_request(NOTIFICATIONS_SERVICE_URL, "/notifications/read", "PUT", read_data, headers, timeout=WRITE_TIMEOUT)
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.json())
     return response.json()
 
 @app.put("/api/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: int, authorization: str = Header(None)):
-    headers = {"Authorization": authorization} if authorization else None
-    response = await forward_request(NOTIFICATIONS_SERVICE_URL, f"/notifications/{notification_id}/read", "PUT", headers=headers)
+    headers = auth_headers(authorization)
+    response = await forward_request(NOTIFICATIONS_SERVICE_URL, f"/notifications/{notification_id}/read", "PUT", headers=headers, timeout=WRITE_TIMEOUT)
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.json())
     return response.json()
@@ -0,0 +1,56 @@
+import asyncio
+
+class SingleFlight:
+    """Agrupa chamadas concorrentes com a mesma chave em uma única execução (single-flight)."""
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key, fn, *args):
+        # Quem chega enquanto a chamada está em andamento espera o mesmo resultado
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(key, fn, args))
+            self._inflight[key] = future
+        # shield: o cancelamento de um chamador não cancela a chamada dos demais
+        return await asyncio.shield(future)
+
+    async def _run(self, key, fn, args):
+        try:
+            return await fn(*args)
+        finally:
+            self._inflight.pop(key, None)
+
+    async def do_many(self, keys, fn):
+        # Versão em lote: fn(chaves) deve retornar {chave: valor}. Chaves já em andamento
+        # reaproveitam a chamada existente e as demais são buscadas juntas em uma só chamada
+        loop = asyncio.get_running_loop()
+        futures = {}
+        pending = []
+        for key in dict.fromkeys(keys):
+            future = self._inflight.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._inflight[key] = future
+                pending.append(key)
+            futures[key] = future
+
+        if pending:
+            batch = asyncio.ensure_future(fn(pending))
+            batch.add_done_callback(lambda task: self._resolve(pending, task))
+
+        results = await asyncio.gather(*(asyncio.shield(future) for future in futures.values()))
+        return dict(zip(futures, results))
+
+    def _resolve(self, keys, task):
+        for key in keys:
+            future = self._inflight.pop(key)
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result().get(key))
+
+    def __len__(self):
+        return len(self._inflight)
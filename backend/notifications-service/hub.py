@@ -0,0 +1,49 @@
+import asyncio
+from collections import defaultdict
+
+# Evento enviado no lugar das mensagens descartadas quando um cliente não acompanha o ritmo;
+# ao recebê-lo o cliente deve buscar o que perdeu com GET /notifications?since_id=...
+RESYNC_EVENT = {"event": "resync", "data": {}}
+
+class NotificationHub:
+    """Pub/sub em memória por user_id, com uma fila limitada para cada conexão."""
+
+    def __init__(self, queue_size: int = 100, max_connections_per_user: int = 5):
+        self.queue_size = queue_size
+        self.max_connections_per_user = max_connections_per_user
+        self._subscribers = defaultdict(set)
+
+    def is_full(self, user_id: int) -> bool:
+        return len(self._subscribers.get(user_id, ())) >= self.max_connections_per_user
+
+    def subscribe(self, user_id: int):
+        subscribers = self._subscribers[user_id]
+        if len(subscribers) >= self.max_connections_per_user:
+            return None
+
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(user_id)
+        if subscribers is None:
+            return
+
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[user_id]
+
+    def publish(self, user_id: int, event: str, data: dict):
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                # Backpressure: em vez de crescer sem limite, a fila do cliente lento é
+                # esvaziada e substituída por um único pedido de ressincronização
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+                continue
+            queue.put_nowait({"event": event, "data": data})
+
+    def connection_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
@@ -1,15 +1,23 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import sys
 import os
+import json
+import gzip
+import secrets
+import asyncio
 
 # Add shared directory to path
 #sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
-from models import Notification, NotificationCreate
+from models import Notification, NotificationCreate, NotificationReadRequest
 from database import Database
+from cache import TTLCache, etag_matches
 from auth import verify_token
-from datetime import datetime
+from hub import NotificationHub
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 import sqlite3
 
 app = FastAPI(title="Notifications Service")
@@ -23,8 +31,48 @@ app.add_middleware(
 )
 
 class NotificationsDatabase(Database):
+    # Permite devolver espaço aos poucos depois da retenção; bancos criados antes disso são
+    # convertidos com "python main.py compact-db"
+    auto_vacuum = "INCREMENTAL"
+    migrations = [
+        # 1: índices para a listagem por usuário e para a contagem de não lidas
+        """
+        CREATE INDEX IF NOT EXISTS idx_notifications_user_created_at ON notifications (user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_notifications_user_read_created_at ON notifications (user_id, is_read, created_at);
+        """,
+        # 2: a listagem pagina por id, então o índice por data deixa de ser usado
+        """
+        DROP INDEX IF EXISTS idx_notifications_user_created_at;
+        CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications (user_id, id);
+        """,
+        # 3: contador materializado de não lidas por usuário, mantido por triggers na mesma
+        # transação de cada INSERT/UPDATE/DELETE e preenchido a partir dos dados existentes
+        """
+        CREATE TABLE IF NOT EXISTS unread_counters (
+            user_id INTEGER PRIMARY KEY,
+            unread_count INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR REPLACE INTO unread_counters (user_id, unread_count)
+            SELECT user_id, COUNT(*) FROM notifications WHERE is_read = FALSE GROUP BY user_id;
+        CREATE TRIGGER IF NOT EXISTS unread_counters_insert AFTER INSERT ON notifications
+        WHEN NOT new.is_read BEGIN
+            INSERT INTO unread_counters (user_id, unread_count) VALUES (new.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET unread_count = unread_count + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS unread_counters_update AFTER UPDATE OF is_read ON notifications
+        WHEN old.is_read IS NOT new.is_read BEGIN
+            UPDATE unread_counters SET unread_count = unread_count + (CASE WHEN new.is_read THEN -1 ELSE 1 END)
+            WHERE user_id = new.user_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS unread_counters_delete AFTER DELETE ON notifications
+        WHEN NOT old.is_read BEGIN
+            UPDATE unread_counters SET unread_count = unread_count - 1 WHERE user_id = old.user_id;
+        END;
+        """,
+    ]
+
     def init_db(self):
-        with self.get_connection() as conn:
+        with self.get_write_connection() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS notifications (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,75 +87,376 @@ class NotificationsDatabase(Database):
 
 db = NotificationsDatabase("data/notifications.db")
 
+NOTIFICATIONS_PAGE_SIZE = int(os.getenv("NOTIFICATIONS_PAGE_SIZE", "50"))
+NOTIFICATIONS_MAX_PAGE_SIZE = int(os.getenv("NOTIFICATIONS_MAX_PAGE_SIZE", "200"))
+NOTIFICATIONS_MAX_BATCH_SIZE = int(os.getenv("NOTIFICATIONS_MAX_BATCH_SIZE", "1000"))
+
+# Retenção: remove notificações lidas mais antigas que N dias e limita o histórico por
+# usuário (0 desativa cada regra), em lotes pequenos para não segurar o escritor
+NOTIFICATIONS_RETENTION_DAYS = int(os.getenv("NOTIFICATIONS_RETENTION_DAYS", "30"))
+NOTIFICATIONS_MAX_PER_USER = int(os.getenv("NOTIFICATIONS_MAX_PER_USER", "1000"))
+NOTIFICATIONS_RETENTION_BATCH_SIZE = int(os.getenv("NOTIFICATIONS_RETENTION_BATCH_SIZE", "500"))
+NOTIFICATIONS_RETENTION_INTERVAL = float(os.getenv("NOTIFICATIONS_RETENTION_INTERVAL", "3600"))
+NOTIFICATIONS_VACUUM_PAGES = int(os.getenv("NOTIFICATIONS_VACUUM_PAGES", "1000"))
+# Se definido, as notificações removidas são gravadas antes em JSONL comprimido (gzip)
+NOTIFICATIONS_ARCHIVE_DIR = os.getenv("NOTIFICATIONS_ARCHIVE_DIR", "")
+
+# Canal de push (Server-Sent Events)
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+SSE_MAX_CONNECTIONS_PER_USER = int(os.getenv("SSE_MAX_CONNECTIONS_PER_USER", "5"))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# Tickets de uso único e curta duração para abrir o stream: EventSource só aceita a
+# credencial na query string, que acaba nos logs de acesso; o JWT nunca vai para a URL
+SSE_TICKET_TTL = float(os.getenv("SSE_TICKET_TTL", "30"))
+SSE_MAX_TICKETS = int(os.getenv("SSE_MAX_TICKETS", "10000"))
+
+hub = NotificationHub(queue_size=SSE_QUEUE_SIZE, max_connections_per_user=SSE_MAX_CONNECTIONS_PER_USER)
+stream_tickets = TTLCache(maxsize=SSE_MAX_TICKETS, ttl=SSE_TICKET_TTL)
+retention_task = None
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "notifications-service"}
 
-@app.post("/notifications")
-async def create_notification(notification: NotificationCreate):
-    with db.get_connection() as conn:
-        cursor = conn.execute("""
-            INSERT INTO notifications (title, message, user_id)
-            VALUES (?, ?, ?)
-        """, (notification.title, notification.message, notification.user_id))
-        conn.commit()
-        
-        notification_id = cursor.lastrowid
-        return {"id": notification_id, "message": "Notification created successfully"}
+def notification_to_dict(row):
+    return {
+        "id": row["id"],
+        "title": row["title"],
+        "message": row["message"],
+        "user_id": row["user_id"],
+        "is_read": bool(row["is_read"]),
+        "created_at": row["created_at"]
+    }
 
-@app.get("/notifications")
-async def get_notifications(current_user_id: int = Depends(verify_token)):
-    with db.get_connection() as conn:
+def insert_notification(conn, notification: NotificationCreate):
+    cursor = conn.execute("""
+        INSERT INTO notifications (title, message, user_id)
+        VALUES (?, ?, ?)
+    """, (notification.title, notification.message, notification.user_id))
+
+    row = conn.execute("""
+        SELECT id, title, message, user_id, is_read, created_at
+        FROM notifications WHERE id = ?
+    """, (cursor.lastrowid,)).fetchone()
+    return notification_to_dict(row)
+
+def insert_notifications(conn, notifications: List[NotificationCreate]):
+    conn.executemany("""
+        INSERT INTO notifications (title, message, user_id)
+        VALUES (?, ?, ?)
+    """, [(notification.title, notification.message, notification.user_id) for notification in notifications])
+
+    # Dentro de uma única transação do único escritor os ids AUTOINCREMENT são consecutivos
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    first_id = last_id - len(notifications) + 1
+
+    rows = conn.execute("""
+        SELECT id, title, message, user_id, is_read, created_at
+        FROM notifications WHERE id BETWEEN ? AND ?
+        ORDER BY id
+    """, (first_id, last_id)).fetchall()
+    return [notification_to_dict(row) for row in rows]
+
+def select_notifications(conn, user_id: int, limit: int, before_id: Optional[int] = None, since_id: Optional[int] = None):
+    if since_id is not None:
+        # Modo incremental: as mais antigas entre as novas primeiro, para o cliente poder
+        # avançar o since_id sem pular notificações quando houver mais que "limit"
+        notifications_rows = conn.execute("""
+            SELECT id, title, message, user_id, is_read, created_at
+            FROM notifications 
+            WHERE user_id = ? AND id > ?
+            ORDER BY id ASC
+            LIMIT ?
+        """, (user_id, since_id, limit)).fetchall()
+        notifications_rows.reverse()
+    elif before_id is not None:
+        notifications_rows = conn.execute("""
+            SELECT id, title, message, user_id, is_read, created_at
+            FROM notifications 
+            WHERE user_id = ? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (user_id, before_id, limit)).fetchall()
+    else:
         notifications_rows = conn.execute("""
             SELECT id, title, message, user_id, is_read, created_at
             FROM notifications 
             WHERE user_id = ?
-            ORDER BY created_at DESC
-        """, (current_user_id,)).fetchall()
-        
-        notifications = []
-        for row in notifications_rows:
-            notifications.append({
-                "id": row["id"],
-                "title": row["title"],
-                "message": row["message"],
-                "user_id": row["user_id"],
-                "is_read": bool(row["is_read"]),
-                "created_at": row["created_at"]
-            })
-        
-        return notifications
+            ORDER BY id DESC
+            LIMIT ?
+        """, (user_id, limit)).fetchall()
+
+    return [notification_to_dict(row) for row in notifications_rows]
+
+def mark_read(conn, notification_id: int, user_id: int):
+    # Check if notification exists and belongs to user
+    notification = conn.execute(
+        "SELECT * FROM notifications WHERE id = ? AND user_id = ?",
+        (notification_id, user_id)
+    ).fetchone()
+
+    if not notification:
+        raise HTTPException(status_code=404, detail="Notification not found")
+
+    conn.execute(
+        "UPDATE notifications SET is_read = TRUE WHERE id = ?",
+        (notification_id,)
+    )
+
+def mark_read_batch(conn, user_id: int, ids: List[int], up_to_id: Optional[int]):
+    # Um único UPDATE por chamada: por lista de ids ou por marca d'água (todas até up_to_id)
+    if ids:
+        placeholders = ", ".join("?" for _ in ids)
+        cursor = conn.execute(f"""
+            UPDATE notifications SET is_read = TRUE
+            WHERE user_id = ? AND is_read = FALSE AND id IN ({placeholders})
+        """, (user_id, *ids))
+    else:
+        cursor = conn.execute("""
+            UPDATE notifications SET is_read = TRUE
+            WHERE user_id = ? AND is_read = FALSE AND id <= ?
+        """, (user_id, up_to_id))
+
+    return {"updated": cursor.rowcount, "unread_count": count_unread(conn, user_id)}
+
+def count_unread(conn, user_id: int):
+    # Leitura por chave primária: não depende do histórico de notificações do usuário
+    row = conn.execute(
+        "SELECT unread_count FROM unread_counters WHERE user_id = ?",
+        (user_id,)
+    ).fetchone()
+    return row["unread_count"] if row else 0
+
+def select_retention_boundary(conn, cutoff: str):
+    # ids e created_at crescem juntos, então tudo abaixo da primeira notificação dentro do
+    # prazo é antigo; o limite vira um intervalo de rowid, sem varrer a tabela inteira
+    row = conn.execute("SELECT MIN(id) AS id FROM notifications WHERE created_at >= ?", (cutoff,)).fetchone()
+    if row["id"] is not None:
+        return row["id"] - 1
+    return conn.execute("SELECT COALESCE(MAX(id), 0) AS id FROM notifications").fetchone()["id"]
+
+def select_users_over_cap(conn, cap: int):
+    # Para cada usuário acima do limite, o maior id que deve ser removido
+    rows = conn.execute("""
+        SELECT user_id FROM notifications GROUP BY user_id HAVING COUNT(*) > ?
+    """, (cap,)).fetchall()
+    return {
+        row["user_id"]: conn.execute("""
+            SELECT id FROM notifications WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+        """, (row["user_id"], cap)).fetchone()["id"]
+        for row in rows
+    }
+
+def select_purge_batch(conn, after_id: int, max_id: int, user_id: Optional[int], limit: int):
+    # Sem user_id: retenção por idade (só as lidas); com user_id: excedente do limite por usuário
+    condition, params = ("is_read = TRUE", ()) if user_id is None else ("user_id = ?", (user_id,))
+    rows = conn.execute(f"""
+        SELECT id, title, message, user_id, is_read, created_at
+        FROM notifications
+        WHERE id > ? AND id <= ? AND {condition}
+        ORDER BY id
+        LIMIT ?
+    """, (after_id, max_id, *params, limit)).fetchall()
+    return [notification_to_dict(row) for row in rows]
+
+def delete_notifications(conn, notification_ids: List[int]):
+    # Os triggers de unread_counters descontam as não lidas removidas
+    placeholders = ", ".join("?" for _ in notification_ids)
+    conn.execute(f"DELETE FROM notifications WHERE id IN ({placeholders})", notification_ids)
+
+def incremental_vacuum(conn, pages: int):
+    # Devolve ao sistema de arquivos até "pages" páginas livres (requer auto_vacuum INCREMENTAL).
+    # Via execute() o sqlite3 avança a PRAGMA um único passo (uma página); executescript a
+    # executa até o fim
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+
+def archive_notifications(notifications: List[dict]):
+    # Um arquivo por dia; cada lote é um membro gzip novo, e arquivos gzip concatenados
+    # continuam legíveis como um único fluxo
+    os.makedirs(NOTIFICATIONS_ARCHIVE_DIR, exist_ok=True)
+    day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    path = os.path.join(NOTIFICATIONS_ARCHIVE_DIR, f"notifications-{day}.jsonl.gz")
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for notification in notifications:
+            f.write(json.dumps(notification, ensure_ascii=False) + "\n")
+
+async def purge_notifications(max_id: int, user_id: Optional[int] = None) -> int:
+    after_id = 0
+    removed = 0
+    while True:
+        batch = await db.read(select_purge_batch, after_id, max_id, user_id, NOTIFICATIONS_RETENTION_BATCH_SIZE)
+        if not batch:
+            return removed
+
+        # O arquivo é gravado antes da remoção: se falhar, nada é apagado
+        if NOTIFICATIONS_ARCHIVE_DIR:
+            await asyncio.to_thread(archive_notifications, batch)
+        await db.write(delete_notifications, [notification["id"] for notification in batch])
+        await db.write_quiet(incremental_vacuum, NOTIFICATIONS_VACUUM_PAGES)
+
+        removed += len(batch)
+        after_id = batch[-1]["id"]
+
+async def run_retention() -> int:
+    removed = 0
+    if NOTIFICATIONS_RETENTION_DAYS > 0:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=NOTIFICATIONS_RETENTION_DAYS)
+        max_id = await db.read(select_retention_boundary, cutoff.strftime("%Y-%m-%d %H:%M:%S"))
+        removed += await purge_notifications(max_id)
+
+    if NOTIFICATIONS_MAX_PER_USER > 0:
+        users_over_cap = await db.read(select_users_over_cap, NOTIFICATIONS_MAX_PER_USER)
+        for user_id, max_id in users_over_cap.items():
+            removed += await purge_notifications(max_id, user_id)
+
+    return removed
+
+async def retention_worker():
+    while True:
+        try:
+            removed = await run_retention()
+            if removed:
+                print(f"Retenção: {removed} notificação(ões) removida(s)")
+        except Exception as e:
+            print(f"Erro na retenção de notificações: {e}")
+        await asyncio.sleep(NOTIFICATIONS_RETENTION_INTERVAL)
+
+@app.on_event("startup")
+async def start_retention_worker():
+    global retention_task
+    if NOTIFICATIONS_RETENTION_INTERVAL > 0:
+        retention_task = asyncio.create_task(retention_worker())
+
+@app.on_event("shutdown")
+async def stop_retention_worker():
+    if retention_task is None:
+        return
+    retention_task.cancel()
+    try:
+        await retention_task
+    except asyncio.CancelledError:
+        pass
+
+@app.post("/notifications")
+async def create_notification(notification: NotificationCreate):
+    created = await db.write(insert_notification, notification)
+    hub.publish(created["user_id"], "notification", created)
+    return {"id": created["id"], "message": "Notification created successfully"}
+
+@app.post("/notifications/batch")
+async def create_notifications_batch(notifications: List[NotificationCreate], response: Response):
+    # O limite vai em toda resposta para quem envia lotes ajustar o tamanho sem configuração
+    response.headers["X-Max-Batch-Size"] = str(NOTIFICATIONS_MAX_BATCH_SIZE)
+    if not notifications:
+        return {"ids": [], "message": "No notifications to create"}
+    if len(notifications) > NOTIFICATIONS_MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {NOTIFICATIONS_MAX_BATCH_SIZE} notifications per batch",
+            headers={"X-Max-Batch-Size": str(NOTIFICATIONS_MAX_BATCH_SIZE)}
+        )
+
+    created = await db.write(insert_notifications, notifications)
+    for notification in created:
+        hub.publish(notification["user_id"], "notification", notification)
+
+    return {"ids": [notification["id"] for notification in created], "message": "Notifications created successfully"}
+
+@app.get("/notifications")
+async def get_notifications(
+    response: Response,
+    limit: int = Query(NOTIFICATIONS_PAGE_SIZE, ge=1, le=NOTIFICATIONS_MAX_PAGE_SIZE),
+    before_id: Optional[int] = None,
+    since_id: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user_id: int = Depends(verify_token)
+):
+    etag = db.etag(current_user_id, limit, before_id, since_id)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    return await db.read(select_notifications, current_user_id, limit, before_id, since_id)
+
+async def event_stream(user_id: int):
+    # A inscrição acontece dentro do gerador: se o cliente desconectar antes da primeira
+    # iteração, nada fica registrado no hub sem o finally que o remove
+    queue = hub.subscribe(user_id)
+    if queue is None:
+        # O limite foi atingido entre a verificação da requisição e o início do stream
+        yield "retry: 5000\n\n"
+        return
+
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Comentário SSE para manter a conexão viva através de proxies
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+    finally:
+        hub.unsubscribe(user_id, queue)
+
+@app.post("/notifications/stream-ticket")
+async def create_stream_ticket(current_user_id: int = Depends(verify_token)):
+    ticket = secrets.token_urlsafe(24)
+    stream_tickets.set(ticket, current_user_id)
+    return {"ticket": ticket, "expires_in": SSE_TICKET_TTL}
+
+@app.get("/notifications/stream")
+async def stream_notifications(ticket: str = Query(...)):
+    # O ticket é consumido na primeira utilização; reconexões pedem um novo
+    current_user_id = stream_tickets.get(ticket)
+    stream_tickets.invalidate(ticket)
+    if current_user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+
+    if hub.is_full(current_user_id):
+        raise HTTPException(status_code=429, detail="Too many open notification streams")
+
+    return StreamingResponse(
+        event_stream(current_user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.put("/notifications/read")
+async def mark_notifications_read(read_request: NotificationReadRequest, current_user_id: int = Depends(verify_token)):
+    if bool(read_request.ids) == (read_request.up_to_id is not None):
+        raise HTTPException(status_code=400, detail="Provide either ids or up_to_id")
+    if len(read_request.ids) > NOTIFICATIONS_MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {NOTIFICATIONS_MAX_BATCH_SIZE} notifications per batch"
+        )
+
+    return await db.write(mark_read_batch, current_user_id, list(dict.fromkeys(read_request.ids)), read_request.up_to_id)
 
 @app.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: int, current_user_id: int = Depends(verify_token)):
-    with db.get_connection() as conn:
-        # Check if notification exists and belongs to user
-        notification = conn.execute(
-            "SELECT * FROM notifications WHERE id = ? AND user_id = ?",
-            (notification_id, current_user_id)
-        ).fetchone()
-        
-        if not notification:
-            raise HTTPException(status_code=404, detail="Notification not found")
-        
-        conn.execute(
-            "UPDATE notifications SET is_read = TRUE WHERE id = ?",
-            (notification_id,)
-        )
-        conn.commit()
-        
-        return {"message": "Notification marked as read"}
+    await db.write(mark_read, notification_id, current_user_id)
+    return {"message": "Notification marked as read"}
 
 @app.get("/notifications/unread-count")
 async def get_unread_count(current_user_id: int = Depends(verify_token)):
-    with db.get_connection() as conn:
-        count = conn.execute(
-            "SELECT COUNT(*) as count FROM notifications WHERE user_id = ? AND is_read = FALSE",
-            (current_user_id,)
-        ).fetchone()
-        
-        return {"unread_count": count["count"]}
+    return {"unread_count": await db.read(count_unread, current_user_id)}
+
+def compact_database():
+    # Conversão única (offline) de bancos criados antes do auto_vacuum incremental: o VACUUM
+    # reescreve o arquivo inteiro e bloqueia o escritor enquanto roda
+    with db.get_write_connection() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    db.close()
+    print(f"auto_vacuum = {mode} (2 = INCREMENTAL)")
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8003)
\ No newline at end of file
+    if sys.argv[1:] == ["compact-db"]:
+        compact_database()
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8003)
\ No newline at end of file
@@ -1,16 +1,34 @@
-from fastapi import HTTPException, Depends, status
+from fastapi import HTTPException, Depends, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from typing import Optional
+from cache import TTLCache
+import hashlib
+import hmac
+import time
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Tokens já verificados, indexados pelo hash do token e válidos até o "exp" de cada um
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# Identidade assinada pelo gateway: os serviços podem confiar nela em vez de decodificar o JWT
+IDENTITY_HEADER = "X-Authenticated-User"
+IDENTITY_HEADER_SECRET = os.getenv("IDENTITY_HEADER_SECRET", SECRET_KEY)
+IDENTITY_HEADER_MAX_AGE = int(os.getenv("IDENTITY_HEADER_MAX_AGE", "60"))
+TRUST_GATEWAY_IDENTITY = os.getenv("TRUST_GATEWAY_IDENTITY", "false").lower() == "true"
+
+# Chamadas internas entre serviços (ex.: eventos de usuário) assinadas com o mesmo segredo
+SERVICE_SIGNATURE_HEADER = "X-Service-Signature"
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-security = HTTPBearer()
+security = HTTPBearer(auto_error=False)
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -28,9 +46,14 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_token(token: str) -> int:
+    token_digest = hashlib.sha256(token.encode()).hexdigest()
+    cached_user_id = token_cache.get(token_digest)
+    if cached_user_id is not None:
+        return cached_user_id
+
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: int = payload.get("sub")
         if user_id is None:
             raise HTTPException(
@@ -38,10 +61,65 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return int(user_id)
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
+
+    expires_in = payload.get("exp", 0) - time.time()
+    if expires_in > 0:
+        token_cache.set(token_digest, int(user_id), ttl=expires_in)
+    return int(user_id)
+
+def _identity_signature(message: str) -> str:
+    return hmac.new(IDENTITY_HEADER_SECRET.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+def sign_identity(user_id: int) -> str:
+    message = f"{user_id}.{int(time.time())}"
+    return f"{message}.{_identity_signature(message)}"
+
+def verify_identity(value: str) -> Optional[int]:
+    try:
+        user_id, issued_at, signature = value.split(".")
+        issued_at = int(issued_at)
+        user_id = int(user_id)
+    except ValueError:
+        return None
+
+    if not hmac.compare_digest(signature, _identity_signature(f"{user_id}.{issued_at}")):
+        return None
+    if abs(time.time() - issued_at) > IDENTITY_HEADER_MAX_AGE:
+        return None
+    return user_id
+
+def sign_service_request(body: bytes = b"") -> str:
+    # A assinatura cobre o corpo: um cabeçalho capturado não serve para outro evento
+    issued_at = int(time.time())
+    body_digest = hashlib.sha256(body).hexdigest()
+    return f"{issued_at}.{_identity_signature(f'service.{issued_at}.{body_digest}')}"
+
+async def verify_service_request(request: Request):
+    try:
+        issued_at, signature = request.headers.get(SERVICE_SIGNATURE_HEADER, "").split(".")
+        issued_at = int(issued_at)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid service signature")
+
+    body_digest = hashlib.sha256(await request.body()).hexdigest()
+    expected = _identity_signature(f"service.{issued_at}.{body_digest}")
+    if not hmac.compare_digest(signature, expected) or abs(time.time() - issued_at) > IDENTITY_HEADER_MAX_AGE:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid service signature")
+
+def verify_token(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if TRUST_GATEWAY_IDENTITY:
+        identity = request.headers.get(IDENTITY_HEADER)
+        if identity:
+            user_id = verify_identity(identity)
+            if user_id is not None:
+                return user_id
+
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authenticated")
+    return decode_token(credentials.credentials)
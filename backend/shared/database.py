@@ -1,22 +1,172 @@
 import sqlite3
+import asyncio
+import hashlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 import os
+import uuid
+
+# Configuração do SQLite (ajustável por variáveis de ambiente)
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))  # valores negativos são em KiB
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # milissegundos
 
 class Database:
-    def __init__(self, db_path: str):
+    # Migrações do schema em ordem; a posição na lista (a partir de 1) é a versão gravada
+    # em PRAGMA user_version, então novas migrações devem sempre ser adicionadas ao final
+    migrations = []
+    # Modo de auto_vacuum (ex.: "INCREMENTAL"); só vale para bancos novos e precisa ser
+    # aplicado antes do journal_mode, que já grava o cabeçalho do arquivo
+    auto_vacuum = None
+
+    def __init__(self, db_path: str, pool_size: int = SQLITE_POOL_SIZE):
         self.db_path = db_path
+        self.pool_size = pool_size
         # Ensure directory exists
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Conexões de leitura reutilizáveis e uma única conexão de escrita (WAL permite
+        # leitores concorrentes enquanto o escritor trabalha)
+        self._pool = queue.LifoQueue()
+        self._pool_lock = threading.Lock()
+        self._open_connections = 0
+        self._writer = None
+        self._write_lock = threading.Lock()
+        # Versão incrementada a cada escrita confirmada (exceto write_quiet); junto com o boot_id (que
+        # muda a cada reinício do processo) identifica o estado do banco para gerar ETags
+        self.boot_id = uuid.uuid4().hex[:12]
+        self.version = 0
+        self._version_lock = threading.Lock()
+        # Threads dedicadas para que as consultas nunca bloqueiem o event loop; uma única
+        # thread de escrita serializa os escritores
+        self._read_executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="sqlite-read")
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
         self.init_db()
-    
+        self.migrate()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if self.auto_vacuum:
+            conn.execute(f"PRAGMA auto_vacuum = {self.auto_vacuum}")
+        conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._pool_lock:
+            can_open = self._open_connections < self.pool_size
+            if can_open:
+                self._open_connections += 1
+
+        if not can_open:
+            # Pool esgotado: espera uma conexão ser devolvida
+            return self._pool.get()
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._pool_lock:
+                self._open_connections -= 1
+            raise
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._pool.put(conn)
+
     @contextmanager
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self._acquire()
         try:
             yield conn
         finally:
+            self._release(conn)
+
+    @contextmanager
+    def get_write_connection(self):
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+
+    def _run_read(self, fn, args):
+        with self.get_connection() as conn:
+            return fn(conn, *args)
+
+    def _run_write(self, fn, args, bump: bool = True):
+        with self.get_write_connection() as conn:
+            result = fn(conn, *args)
+            conn.commit()
+            if bump:
+                self.bump_version()
+            return result
+
+    async def read(self, fn, *args):
+        # Executa fn(conn, *args) em uma thread de leitura
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._run_read, fn, args)
+
+    async def write(self, fn, *args):
+        # Executa fn(conn, *args) na thread de escrita, em uma única transação
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self._run_write, fn, args)
+
+    async def write_quiet(self, fn, *args):
+        # Como write, mas sem mudar a versão: para escritas que não alteram nada do que as
+        # respostas com ETag devolvem (reparo de projeções, controle interno, manutenção)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self._run_write, fn, args, False)
+
+    def bump_version(self):
+        with self._version_lock:
+            self.version += 1
+
+    def etag(self, *parts) -> str:
+        # ETag fraco derivado da versão atual do banco e das partes que distinguem a resposta
+        # (usuário, parâmetros da consulta...). Deve ser calculado ANTES da leitura: se uma
+        # escrita acontecer no meio, o cliente apenas recebe o corpo completo outra vez
+        key = "|".join(str(part) for part in (self.boot_id, self.version, *parts))
+        return 'W/"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+    def close(self):
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
             conn.close()
-    
+            with self._pool_lock:
+                self._open_connections -= 1
+
+    def migrate(self):
+        with self.get_write_connection() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, script in enumerate(self.migrations[version:], start=version + 1):
+                # Cada migração é aplicada em sua própria transação junto com a nova versão
+                conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+
     def init_db(self):
-        pass  # To be overridden by specific services
\ No newline at end of file
+        pass  # To be overridden by specific services
@@ -1,12 +1,22 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import sys
+import json
+import base64
+import binascii
+import time
+import asyncio
 import httpx
 
-from models import TaskCreate, TaskUpdate
+from models import TaskCreate, TaskUpdate, TaskBulkRequest, TaskStatus, TaskPriority, UserEvent
 from database import Database
-from auth import verify_token
-from datetime import datetime
+from cache import TTLCache, etag_matches
+from singleflight import SingleFlight
+from auth import verify_token, verify_service_request
+from datetime import datetime, timedelta
+from typing import Optional
+from collections import Counter
 
 app = FastAPI(title="Tasks Service")
 
@@ -20,10 +30,81 @@ app.add_middleware(
 
 USERS_SERVICE_URL = os.getenv("USERS_SERVICE_URL", "http://users-service:8002")
 NOTIFICATIONS_SERVICE_URL = os.getenv("NOTIFICATIONS_SERVICE_URL", "http://notifications-service:8003")
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+# Busca de usuários em lotes concorrentes, com timeout por chamada e modo degradado
+USER_LOOKUP_CHUNK_SIZE = int(os.getenv("USER_LOOKUP_CHUNK_SIZE", "100"))
+USER_LOOKUP_CONCURRENCY = int(os.getenv("USER_LOOKUP_CONCURRENCY", "4"))
+USER_LOOKUP_TIMEOUT = float(os.getenv("USER_LOOKUP_TIMEOUT", "2"))
+USER_LOOKUP_DEGRADED_SECONDS = float(os.getenv("USER_LOOKUP_DEGRADED_SECONDS", "30"))
+TASKS_PAGE_SIZE = int(os.getenv("TASKS_PAGE_SIZE", "100"))
+TASKS_MAX_PAGE_SIZE = int(os.getenv("TASKS_MAX_PAGE_SIZE", "500"))
+TASKS_SEARCH_PAGE_SIZE = int(os.getenv("TASKS_SEARCH_PAGE_SIZE", "20"))
+TASKS_SEARCH_MAX_PAGE_SIZE = int(os.getenv("TASKS_SEARCH_MAX_PAGE_SIZE", "100"))
+# A busca pagina por deslocamento; além deste ponto os resultados deixam de ser paginados
+TASKS_SEARCH_MAX_OFFSET = int(os.getenv("TASKS_SEARCH_MAX_OFFSET", "10000"))
+TASKS_STATS_CACHE_SIZE = int(os.getenv("TASKS_STATS_CACHE_SIZE", "10000"))
+TASKS_STATS_CACHE_TTL = float(os.getenv("TASKS_STATS_CACHE_TTL", "60"))
+TASKS_DUE_SOON_HOURS = float(os.getenv("TASKS_DUE_SOON_HOURS", "48"))
+TASKS_MAX_BULK_SIZE = int(os.getenv("TASKS_MAX_BULK_SIZE", "1000"))
+
+# Despacho assíncrono das notificações gravadas na outbox
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_BASE_BACKOFF = float(os.getenv("OUTBOX_BASE_BACKOFF", "1"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "20"))
 
 class TasksDatabase(Database):
+    migrations = [
+        # 1: índices para "tarefas criadas por / atribuídas a" ordenadas por data
+        """
+        CREATE INDEX IF NOT EXISTS idx_tasks_created_by_created_at ON tasks (created_by, created_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_assigned_to_created_at ON tasks (assigned_to, created_at);
+        """,
+        # 2: outbox de notificações, gravada na mesma transação que a tarefa
+        """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            message TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_notification_outbox_next_attempt_at ON notification_outbox (next_attempt_at);
+        """,
+        # 3: projeção local dos nomes de usuários, alimentada pelos eventos do users-service
+        """
+        CREATE TABLE IF NOT EXISTS user_names (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        # 4: índice de busca textual (FTS5) sobre título e descrição, sincronizado por triggers
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            title, description, content='tasks', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO tasks_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+        END;
+        INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild');
+        """,
+    ]
+
     def init_db(self):
-        with self.get_connection() as conn:
+        with self.get_write_connection() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS tasks (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -42,104 +123,431 @@ class TasksDatabase(Database):
 
 db = TasksDatabase("data/tasks.db")
 
-async def get_user_info(user_id: int):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{USERS_SERVICE_URL}/users/{user_id}")
-            if response.status_code == 200:
-                return response.json()
-            return None
-        except:
-            return None
-
-async def send_notification(user_id: int, title: str, message: str):
-    async with httpx.AsyncClient() as client:
+# Cliente HTTP compartilhado (keep-alive) criado no startup
+http_client = None
+outbox_task = None
+outbox_wakeup = asyncio.Event()
+# Tamanho do lote da outbox; começa no OUTBOX_BATCH_SIZE e é reduzido ao limite do servidor
+outbox_batch_size = OUTBOX_BATCH_SIZE
+
+# Perfis de usuários mudam raramente; o users-service avisa via /events/users quando mudam
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+# Contagens do dashboard por usuário; cada entrada guarda a versão das tarefas do usuário em
+# que foi calculada, então só escritas em tarefas criadas por ele ou atribuídas a ele a
+# invalidam. O TTL cobre a passagem do tempo (tarefas que ficam atrasadas sem nenhuma escrita)
+stats_cache = TTLCache(maxsize=TASKS_STATS_CACHE_SIZE, ttl=TASKS_STATS_CACHE_TTL)
+task_versions = Counter()
+# Requisições concorrentes que precisam dos mesmos usuários compartilham a busca em andamento
+user_flight = SingleFlight()
+# Limita as chamadas simultâneas ao users-service somando todas as requisições
+user_lookup_semaphore = asyncio.Semaphore(USER_LOOKUP_CONCURRENCY)
+users_degraded_until = 0.0
+
+def users_service_degraded() -> bool:
+    return time.monotonic() < users_degraded_until
+
+async def fetch_users_chunk(user_ids):
+    global users_degraded_until
+    async with user_lookup_semaphore:
         try:
-            await client.post(
-                f"{NOTIFICATIONS_SERVICE_URL}/notifications",
-                json={"user_id": user_id, "title": title, "message": message}
+            response = await http_client.post(
+                f"{USERS_SERVICE_URL}/users/batch",
+                json={"ids": user_ids},
+                timeout=USER_LOOKUP_TIMEOUT
             )
-        except:
+            response.raise_for_status()
+            users = response.json()
+        except (httpx.HTTPError, ValueError):
+            # users-service lento ou fora do ar: por um tempo os nomes saem como "Unknown"
+            # imediatamente, em vez de cada requisição esperar o timeout
+            users_degraded_until = time.monotonic() + USER_LOOKUP_DEGRADED_SECONDS
+            return {}
+
+    for user in users:
+        user_cache.set(user["id"], user)
+    return {user["id"]: user for user in users}
+
+async def fetch_users(user_ids):
+    # Os lotes são buscados em paralelo: a latência acompanha a chamada mais lenta, não a soma
+    chunks = [user_ids[i:i + USER_LOOKUP_CHUNK_SIZE] for i in range(0, len(user_ids), USER_LOOKUP_CHUNK_SIZE)]
+    users = {}
+    for chunk_users in await asyncio.gather(*(fetch_users_chunk(chunk) for chunk in chunks)):
+        users.update(chunk_users)
+    return users
+
+def select_user_names(conn, user_ids):
+    placeholders = ", ".join("?" for _ in user_ids)
+    rows = conn.execute(f"""
+        SELECT user_id, name, email FROM user_names WHERE user_id IN ({placeholders})
+    """, user_ids).fetchall()
+    return {row["user_id"]: {"id": row["user_id"], "name": row["name"], "email": row["email"]} for row in rows}
+
+def upsert_user_names(conn, users):
+    conn.executemany("""
+        INSERT INTO user_names (user_id, name, email) VALUES (?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            name = excluded.name, email = excluded.email, updated_at = CURRENT_TIMESTAMP
+    """, [(user["id"], user["name"], user.get("email")) for user in users])
+
+def delete_user_name(conn, user_id: int):
+    conn.execute("DELETE FROM user_names WHERE user_id = ?", (user_id,))
+
+async def get_users_info(user_ids):
+    # Resolve os usuários distintos pelo cache, depois pela projeção local e só busca
+    # no users-service os que faltarem
+    unique_ids = sorted({user_id for user_id in user_ids if user_id})
+    users = {}
+    missing_ids = []
+    for user_id in unique_ids:
+        user = user_cache.get(user_id)
+        if user is None:
+            missing_ids.append(user_id)
+        else:
+            users[user_id] = user
+
+    if missing_ids:
+        projected = await db.read(select_user_names, missing_ids)
+        for user_id, user in projected.items():
+            user_cache.set(user_id, user)
+        users.update(projected)
+        missing_ids = [user_id for user_id in missing_ids if user_id not in projected]
+
+    if not missing_ids or users_service_degraded():
+        return users
+
+    fetched = await user_flight.do_many(missing_ids, fetch_users)
+    users.update({user_id: user for user_id, user in fetched.items() if user is not None})
+    return users
+
+def build_task_response(task_row, users: dict):
+    created_by_info = users.get(task_row["created_by"])
+    assigned_user_info = users.get(task_row["assigned_to"]) if task_row["assigned_to"] else None
+
+    return {
+        "id": task_row["id"],
+        "title": task_row["title"],
+        "description": task_row["description"],
+        "status": task_row["status"],
+        "priority": task_row["priority"],
+        "assigned_to": task_row["assigned_to"],
+        "assigned_user_name": assigned_user_info["name"] if assigned_user_info else None,
+        "due_date": task_row["due_date"],
+        "created_at": task_row["created_at"],
+        "updated_at": task_row["updated_at"],
+        "created_by": task_row["created_by"],
+        "created_by_name": created_by_info["name"] if created_by_info else "Unknown"
+    }
+
+def enqueue_notification(conn, user_id: int, title: str, message: str):
+    conn.execute("""
+        INSERT INTO notification_outbox (user_id, title, message)
+        VALUES (?, ?, ?)
+    """, (user_id, title, message))
+
+def select_due_notifications(conn, now: float, limit: int):
+    return conn.execute("""
+        SELECT id, user_id, title, message, attempts
+        FROM notification_outbox
+        WHERE next_attempt_at <= ?
+        ORDER BY id
+        LIMIT ?
+    """, (now, limit)).fetchall()
+
+def complete_outbox_batch(conn, finished_ids, retries):
+    conn.executemany("DELETE FROM notification_outbox WHERE id = ?", [(outbox_id,) for outbox_id in finished_ids])
+    conn.executemany(
+        "UPDATE notification_outbox SET attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+        retries
+    )
+
+def retry_delay(attempts: int) -> float:
+    return min(OUTBOX_MAX_BACKOFF, OUTBOX_BASE_BACKOFF * (2 ** attempts))
+
+def learn_outbox_batch_size(response: httpx.Response):
+    # O notifications-service informa o maior lote que aceita; o OUTBOX_BATCH_SIZE local
+    # continua sendo o teto, mas nunca é usado acima do limite do servidor
+    global outbox_batch_size
+    try:
+        server_max = int(response.headers["X-Max-Batch-Size"])
+    except (KeyError, ValueError):
+        return False
+    outbox_batch_size = max(1, min(OUTBOX_BATCH_SIZE, server_max))
+    return True
+
+def rejected_outbox_rows(rows, response: httpx.Response):
+    # Na validação do FastAPI cada erro aponta o item inválido em loc ("body", índice, campo);
+    # sem essa informação não há como separar o lote e ele é descartado inteiro
+    try:
+        indexes = {error["loc"][1] for error in response.json()["detail"]}
+    except (ValueError, KeyError, IndexError, TypeError):
+        return rows
+    if not indexes or not all(isinstance(index, int) and 0 <= index < len(rows) for index in indexes):
+        return rows
+    return [rows[index] for index in sorted(indexes)]
+
+async def dispatch_outbox_batch() -> int:
+    global outbox_batch_size
+    rows = await db.read(select_due_notifications, time.time(), outbox_batch_size)
+    if not rows:
+        return 0
+
+    # Linhas fora de finished_ids e failed_rows continuam pendentes, sem contar tentativa,
+    # e são reenviadas na próxima rodada
+    finished_ids = []
+    failed_rows = []
+    try:
+        response = await http_client.post(
+            f"{NOTIFICATIONS_SERVICE_URL}/notifications/batch",
+            json=[
+                {"user_id": row["user_id"], "title": row["title"], "message": row["message"]}
+                for row in rows
+            ]
+        )
+    except httpx.HTTPError as e:
+        print(f"Falha ao enviar notificações: {e}")
+        failed_rows = rows
+    else:
+        learned = learn_outbox_batch_size(response)
+        if response.status_code == 200:
+            finished_ids = [row["id"] for row in rows]
+        elif response.status_code in (400, 422):
+            # Só um payload inválido não se resolve com nova tentativa; as demais do lote
+            # não foram gravadas e voltam na próxima rodada
+            rejected = rejected_outbox_rows(rows, response)
+            print(f"{len(rejected)} notificação(ões) descartada(s): {response.status_code} {response.text}")
+            finished_ids = [row["id"] for row in rejected]
+        elif response.status_code == 413 and len(rows) > 1:
+            # Lote maior que o aceito: reenvia menor, sem penalizar as notificações
+            if not learned:
+                outbox_batch_size = max(1, len(rows) // 2)
+        else:
+            # 404 (serviço antigo), 408, 429, 5xx...: nada se perde, tenta de novo mais tarde
+            print(f"Falha ao enviar notificações: {response.status_code}")
+            failed_rows = rows
+
+    now = time.time()
+    retries = []
+    for row in failed_rows:
+        if row["attempts"] + 1 >= OUTBOX_MAX_ATTEMPTS:
+            print(f"Notificação {row['id']} descartada após {OUTBOX_MAX_ATTEMPTS} tentativas")
+            finished_ids.append(row["id"])
+        else:
+            retries.append((now + retry_delay(row["attempts"]), row["id"]))
+
+    await db.write_quiet(complete_outbox_batch, finished_ids, retries)
+    return len(rows)
+
+async def outbox_worker():
+    while True:
+        outbox_wakeup.clear()
+        try:
+            processed = await dispatch_outbox_batch()
+        except Exception as e:
+            print(f"Erro no despacho da outbox: {e}")
+            processed = 0
+
+        if processed >= outbox_batch_size:
+            continue  # ainda há notificações pendentes
+
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
             pass
 
+@app.on_event("startup")
+async def start_background_services():
+    global http_client, outbox_task
+    http_client = httpx.AsyncClient(timeout=10.0)
+    outbox_task = asyncio.create_task(outbox_worker())
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    outbox_task.cancel()
+    try:
+        await outbox_task
+    except asyncio.CancelledError:
+        pass
+    await http_client.aclose()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "tasks-service"}
 
-@app.get("/tasks")
-async def get_tasks(current_user_id: int = Depends(verify_token)):
-    with db.get_connection() as conn:
-        tasks_rows = conn.execute("""
-            SELECT id, title, description, status, priority, assigned_to, 
-                   due_date, created_at, updated_at, created_by
-            FROM tasks 
-            WHERE created_by = ? OR assigned_to = ?
-            ORDER BY created_at DESC
-        """, (current_user_id, current_user_id)).fetchall()
-        
-        tasks = []
-        for row in tasks_rows:
-            created_by_info = await get_user_info(row["created_by"])
-            assigned_user_info = None
-            if row["assigned_to"]:
-                assigned_user_info = await get_user_info(row["assigned_to"])
-            
-            tasks.append({
-                "id": row["id"],
-                "title": row["title"],
-                "description": row["description"],
-                "status": row["status"],
-                "priority": row["priority"],
-                "assigned_to": row["assigned_to"],
-                "assigned_user_name": assigned_user_info["name"] if assigned_user_info else None,
-                "due_date": row["due_date"],
-                "created_at": row["created_at"],
-                "updated_at": row["updated_at"],
-                "created_by": row["created_by"],
-                "created_by_name": created_by_info["name"] if created_by_info else "Unknown"
-            })
-        
-        return tasks
+@app.post("/events/users", dependencies=[Depends(verify_service_request)])
+async def handle_user_event(event: UserEvent):
+    # Chamado pelo users-service quando um usuário é criado ou alterado; a escrita na
+    # projeção também invalida os ETags de /tasks, que incluem os nomes. Só aceita chamadas
+    # assinadas, já que a porta do serviço fica exposta
+    if event.name is not None:
+        await db.write(upsert_user_names, [{"id": event.user_id, "name": event.name, "email": event.email}])
+    else:
+        await db.write(delete_user_name, event.user_id)
+    user_cache.invalidate(event.user_id)
+    return {"message": "Event processed"}
 
-@app.post("/tasks")
-async def create_task(task: TaskCreate, current_user_id: int = Depends(verify_token)):
-    with db.get_connection() as conn:
-        cursor = conn.execute("""
-            INSERT INTO tasks (title, description, priority, assigned_to, due_date, created_by)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (task.title, task.description, task.priority, task.assigned_to, task.due_date, current_user_id))
-        conn.commit()
-
-        task_id = cursor.lastrowid
-
-        if task.assigned_to and task.assigned_to != current_user_id:
-            await send_notification(
-                task.assigned_to,
-                "Nova tarefa atribuída",
-                f"Uma nova tarefa '{task.title}' foi atribuída para você."
-            )
+@app.get("/cache/users/stats", dependencies=[Depends(verify_service_request)])
+async def get_user_cache_stats():
+    return user_cache.stats()
+
+def encode_cursor(task_row) -> str:
+    payload = json.dumps([task_row["created_at"], task_row["id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), int(task_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def select_user_tasks(conn, user_id: int, filters: dict, limit: int, cursor: Optional[str] = None):
+    # Paginação por keyset em (created_at, id). "Criadas por" e "atribuídas a" são dois ramos,
+    # cada um percorrendo o próprio índice já na ordem da página e parando em limit + 1; só a
+    # união desses ramos (sem duplicatas) é reordenada e cortada. Com um OR no WHERE o SQLite
+    # juntaria todas as tarefas visíveis e as ordenaria antes do LIMIT, em qualquer página
+    conditions = []
+    params = []
+
+    if filters.get("status") is not None:
+        conditions.append("status = ?")
+        params.append(filters["status"])
+    if filters.get("priority") is not None:
+        conditions.append("priority = ?")
+        params.append(filters["priority"])
+    if filters.get("assigned_to") is not None:
+        conditions.append("assigned_to = ?")
+        params.append(filters["assigned_to"])
+    if filters.get("due_after") is not None:
+        conditions.append("due_date >= ?")
+        params.append(filters["due_after"])
+    if filters.get("due_before") is not None:
+        conditions.append("due_date <= ?")
+        params.append(filters["due_before"])
+    if cursor:
+        conditions.append("(created_at, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+
+    extra_conditions = "".join(f" AND {condition}" for condition in conditions)
+
+    def page_branch(column: str) -> str:
+        return f"""
+            SELECT id, created_at FROM (
+                SELECT id, created_at FROM tasks
+                WHERE {column} = ?{extra_conditions}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            )"""
+
+    branch_params = [user_id, *params, limit + 1]
+    # Os nomes vêm da projeção local user_names (NULL quando o usuário ainda não está nela)
+    tasks_rows = conn.execute(f"""
+        SELECT t.id, t.title, t.description, t.status, t.priority, t.assigned_to,
+               t.due_date, t.created_at, t.updated_at, t.created_by,
+               creator.name AS created_by_name, assignee.name AS assigned_user_name
+        FROM (
+            {page_branch("created_by")}
+            UNION
+            {page_branch("assigned_to")}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        ) page
+        JOIN tasks t ON t.id = page.id
+        LEFT JOIN user_names creator ON creator.user_id = t.created_by
+        LEFT JOIN user_names assignee ON assignee.user_id = t.assigned_to
+        ORDER BY page.created_at DESC, page.id DESC
+    """, [*branch_params, *branch_params, limit + 1]).fetchall()
+
+    # Uma linha a mais indica que existe uma próxima página
+    next_cursor = encode_cursor(tasks_rows[limit - 1]) if len(tasks_rows) > limit else None
+    return tasks_rows[:limit], next_cursor
+
+def fts_query(text: str) -> str:
+    # Cada palavra vira um termo entre aspas (sem operadores do FTS5) com busca por prefixo
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"*' for term in terms)
+
+def encode_search_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([offset]).encode()).decode()
+
+def decode_search_cursor(cursor: str) -> int:
+    try:
+        (offset,) = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        offset = max(int(offset), 0)
+    except (ValueError, TypeError, OverflowError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset > TASKS_SEARCH_MAX_OFFSET:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
+def search_user_tasks(conn, user_id: int, text: str, limit: int, cursor: Optional[str] = None):
+    # Ordena por relevância (bm25) e só considera tarefas visíveis para o usuário; como o
+    # ranking não tem chave estável, o cursor guarda o deslocamento
+    offset = decode_search_cursor(cursor) if cursor else 0
+    tasks_rows = conn.execute("""
+        SELECT t.id, t.title, t.description, t.status, t.priority, t.assigned_to,
+               t.due_date, t.created_at, t.updated_at, t.created_by,
+               creator.name AS created_by_name, assignee.name AS assigned_user_name
+        FROM tasks_fts
+        JOIN tasks t ON t.id = tasks_fts.rowid
+        LEFT JOIN user_names creator ON creator.user_id = t.created_by
+        LEFT JOIN user_names assignee ON assignee.user_id = t.assigned_to
+        WHERE tasks_fts MATCH ? AND (t.created_by = ? OR t.assigned_to = ?)
+        ORDER BY bm25(tasks_fts), t.id DESC
+        LIMIT ? OFFSET ?
+    """, (fts_query(text), user_id, user_id, limit + 1, offset)).fetchall()
 
-        task_row = conn.execute("""
-            SELECT * FROM tasks WHERE id = ?
-        """, (task_id,)).fetchone()
-
-        created_by_info = await get_user_info(task_row["created_by"])
-        assigned_user_info = await get_user_info(task_row["assigned_to"]) if task_row["assigned_to"] else None
-
-        return {
-            "id": task_row["id"],
-            "title": task_row["title"],
-            "description": task_row["description"],
-            "status": task_row["status"],
-            "priority": task_row["priority"],
-            "assigned_to": task_row["assigned_to"],
-            "assigned_user_name": assigned_user_info["name"] if assigned_user_info else None,
-            "due_date": task_row["due_date"],
-            "created_at": task_row["created_at"],
-            "updated_at": task_row["updated_at"],
-            "created_by": task_row["created_by"],
-            "created_by_name": created_by_info["name"] if created_by_info else "Unknown"
-        }
+    has_more = len(tasks_rows) > limit and offset + limit <= TASKS_SEARCH_MAX_OFFSET
+    next_cursor = encode_search_cursor(offset + limit) if has_more else None
+    return tasks_rows[:limit], next_cursor
+
+def select_task_stats(conn, user_id: int, now: datetime, due_soon_until: datetime):
+    # Uma única agregação sobre as tarefas visíveis (usa os índices de created_by e assigned_to)
+    rows = conn.execute("""
+        SELECT status, priority, COUNT(*) AS total,
+               SUM(due_date < :now AND status NOT IN ('completed', 'cancelled')) AS overdue,
+               SUM(due_date >= :now AND due_date < :soon AND status NOT IN ('completed', 'cancelled')) AS due_soon
+        FROM tasks
+        WHERE created_by = :user_id OR assigned_to = :user_id
+        GROUP BY status, priority
+    """, {"now": now, "soon": due_soon_until, "user_id": user_id}).fetchall()
+
+    stats = {
+        "total": 0,
+        "by_status": {task_status.value: 0 for task_status in TaskStatus},
+        "by_priority": {task_priority.value: 0 for task_priority in TaskPriority},
+        "overdue": 0,
+        "due_soon": 0
+    }
+    for row in rows:
+        stats["total"] += row["total"]
+        stats["by_status"][row["status"]] = stats["by_status"].get(row["status"], 0) + row["total"]
+        stats["by_priority"][row["priority"]] = stats["by_priority"].get(row["priority"], 0) + row["total"]
+        stats["overdue"] += row["overdue"] or 0
+        stats["due_soon"] += row["due_soon"] or 0
+    return stats
+
+def insert_task_row(conn, task: TaskCreate, created_by: int):
+    cursor = conn.execute("""
+        INSERT INTO tasks (title, description, priority, assigned_to, due_date, created_by)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (task.title, task.description, task.priority, task.assigned_to, task.due_date, created_by))
+
+    return conn.execute("""
+        SELECT * FROM tasks WHERE id = ?
+    """, (cursor.lastrowid,)).fetchone()
+
+def insert_task(conn, task: TaskCreate, created_by: int):
+    task_row = insert_task_row(conn, task, created_by)
+
+    if task.assigned_to and task.assigned_to != created_by:
+        enqueue_notification(
+            conn,
+            task.assigned_to,
+            "Nova tarefa atribuída",
+            f"Uma nova tarefa '{task.title}' foi atribuída para você."
+        )
+
+    return task_row
 
 def traduzir_status(status: str) -> str:
     traducoes = {
@@ -150,91 +558,278 @@ def traduzir_status(status: str) -> str:
     }
     return traducoes.get(status.lower(), status)
 
+def status_changed(existing_task, task_update: TaskUpdate) -> bool:
+    return bool(task_update.status) and task_update.status.lower() != existing_task["status"].lower()
+
+def update_task_row(conn, task_id: int, task_update: TaskUpdate):
+    existing_task = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    if not existing_task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    update_fields = []
+    update_values = []
+
+    if task_update.title is not None:
+        update_fields.append("title = ?")
+        update_values.append(task_update.title)
+    if task_update.description is not None:
+        update_fields.append("description = ?")
+        update_values.append(task_update.description)
+    if task_update.status is not None:
+        update_fields.append("status = ?")
+        update_values.append(task_update.status)
+    if task_update.priority is not None:
+        update_fields.append("priority = ?")
+        update_values.append(task_update.priority)
+    if task_update.assigned_to is not None:
+        update_fields.append("assigned_to = ?")
+        update_values.append(task_update.assigned_to)
+    if task_update.due_date is not None:
+        update_fields.append("due_date = ?")
+        update_values.append(task_update.due_date)
+
+    if not update_fields:
+        return existing_task, existing_task
+
+    update_fields.append("updated_at = ?")
+    update_values.append(datetime.now().isoformat())
+    update_values.append(task_id)
+
+    conn.execute(
+        f"UPDATE tasks SET {', '.join(update_fields)} WHERE id = ?",
+        update_values
+    )
+
+    updated_task = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    return existing_task, updated_task
+
+def apply_task_update(conn, task_id: int, task_update: TaskUpdate):
+    existing_task, updated_task = update_task_row(conn, task_id, task_update)
+
+    if status_changed(existing_task, task_update) and updated_task["assigned_to"]:
+        status_pt = traduzir_status(task_update.status)
+        enqueue_notification(
+            conn,
+            updated_task["assigned_to"],
+            "Status da tarefa alterado",
+            f"A tarefa '{updated_task['title']}' teve seu status alterado para {status_pt}."
+        )
+
+    return existing_task, updated_task
+
+def delete_task_row(conn, task_id: int):
+    task = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+    return task
+
+def apply_bulk_operations(conn, bulk: TaskBulkRequest, current_user_id: int):
+    # Todas as operações na mesma transação: qualquer erro desfaz o lote inteiro
+    created_rows = [insert_task_row(conn, task, current_user_id) for task in bulk.create]
+
+    updated_rows = []
+    # Versões anteriores das tarefas alteradas ou removidas, para saber de quem eram
+    previous_rows = []
+    status_changes = Counter()
+    for task_update in bulk.update:
+        existing_task, updated_task = update_task_row(conn, task_update.id, task_update)
+        updated_rows.append(updated_task)
+        previous_rows.append(existing_task)
+        if status_changed(existing_task, task_update) and updated_task["assigned_to"]:
+            status_changes[updated_task["assigned_to"]] += 1
+
+    for task_id in bulk.delete:
+        previous_rows.append(delete_task_row(conn, task_id))
+
+    # No máximo uma notificação por responsável afetado, resumindo o lote
+    new_assignments = Counter(
+        task.assigned_to for task in bulk.create
+        if task.assigned_to and task.assigned_to != current_user_id
+    )
+    for user_id in sorted(set(new_assignments) | set(status_changes)):
+        parts = []
+        if new_assignments[user_id]:
+            parts.append(f"{new_assignments[user_id]} nova(s) tarefa(s) atribuída(s) a você")
+        if status_changes[user_id]:
+            parts.append(f"{status_changes[user_id]} tarefa(s) com status alterado")
+        enqueue_notification(conn, user_id, "Tarefas atualizadas", " e ".join(parts) + ".")
+
+    return created_rows, updated_rows, previous_rows
+
+def bump_task_versions(*task_rows):
+    # Chamado depois do commit, como o db.version: uma leitura de estatísticas que começou antes
+    # fica com a versão antiga e é descartada na próxima consulta
+    for row in task_rows:
+        task_versions[row["created_by"]] += 1
+        if row["assigned_to"]:
+            task_versions[row["assigned_to"]] += 1
+
+async def task_page_response(response: Response, tasks_rows, next_cursor: Optional[str], etag: str):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    users = {}
+    missing_ids = set()
+    for row in tasks_rows:
+        for user_id, name in ((row["created_by"], row["created_by_name"]), (row["assigned_to"], row["assigned_user_name"])):
+            if name is not None:
+                users[user_id] = {"id": user_id, "name": name}
+            elif user_id:
+                missing_ids.add(user_id)
+
+    # Só os usuários ausentes da projeção são resolvidos fora dela (cache ou users-service),
+    # e passam a ser gravados nela (read-repair). A gravação não muda a versão do banco: os
+    # nomes já estão nesta resposta, e o ETag calculado antes da leitura continua valendo
+    if missing_ids:
+        resolved = await get_users_info(missing_ids)
+        if resolved:
+            await db.write_quiet(upsert_user_names, list(resolved.values()))
+        users.update(resolved)
+    if missing_ids <= users.keys() or not users_service_degraded():
+        # Respostas com nomes "Unknown" ficam sem ETag para não serem revalidadas como atuais
+        response.headers["ETag"] = etag
+
+    return [build_task_response(row, users) for row in tasks_rows]
+
+@app.get("/tasks")
+async def get_tasks(
+    response: Response,
+    limit: int = Query(TASKS_PAGE_SIZE, ge=1, le=TASKS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[TaskStatus] = None,
+    priority: Optional[TaskPriority] = None,
+    assigned_to: Optional[int] = None,
+    due_after: Optional[datetime] = None,
+    due_before: Optional[datetime] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user_id: int = Depends(verify_token)
+):
+    filters = {
+        "status": status.value if status else None,
+        "priority": priority.value if priority else None,
+        "assigned_to": assigned_to,
+        "due_after": due_after,
+        "due_before": due_before
+    }
+    etag = db.etag(current_user_id, limit, cursor, sorted(filters.items()))
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    tasks_rows, next_cursor = await db.read(select_user_tasks, current_user_id, filters, limit, cursor)
+    return await task_page_response(response, tasks_rows, next_cursor, etag)
+
+@app.get("/tasks/search")
+async def search_tasks(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(TASKS_SEARCH_PAGE_SIZE, ge=1, le=TASKS_SEARCH_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user_id: int = Depends(verify_token)
+):
+    if not q.split():
+        raise HTTPException(status_code=400, detail="Empty search query")
+
+    etag = db.etag(current_user_id, "search", q, limit, cursor)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    tasks_rows, next_cursor = await db.read(search_user_tasks, current_user_id, q, limit, cursor)
+    return await task_page_response(response, tasks_rows, next_cursor, etag)
+
+@app.get("/tasks/stats")
+async def get_task_stats(current_user_id: int = Depends(verify_token)):
+    # A versão é lida antes da consulta: se houver escrita no meio, a entrada já nasce velha
+    version = task_versions[current_user_id]
+    cached = stats_cache.get(current_user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    now = datetime.now()
+    stats = await db.read(select_task_stats, current_user_id, now, now + timedelta(hours=TASKS_DUE_SOON_HOURS))
+    stats_cache.set(current_user_id, (version, stats))
+    return stats
+
+@app.post("/tasks")
+async def create_task(task: TaskCreate, current_user_id: int = Depends(verify_token)):
+    task_row = await db.write(insert_task, task, current_user_id)
+    bump_task_versions(task_row)
+    outbox_wakeup.set()
+
+    users = await get_users_info([task_row["created_by"], task_row["assigned_to"]])
+
+    return build_task_response(task_row, users)
+
+@app.post("/tasks/bulk")
+async def bulk_tasks(bulk: TaskBulkRequest, current_user_id: int = Depends(verify_token)):
+    operations = len(bulk.create) + len(bulk.update) + len(bulk.delete)
+    if operations > TASKS_MAX_BULK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {TASKS_MAX_BULK_SIZE} operations per request"
+        )
+
+    created_rows, updated_rows, previous_rows = await db.write(apply_bulk_operations, bulk, current_user_id)
+    bump_task_versions(*created_rows, *updated_rows, *previous_rows)
+    outbox_wakeup.set()
+
+    # Usuários resolvidos uma única vez para o lote inteiro
+    user_ids = set()
+    for row in created_rows + updated_rows:
+        user_ids.add(row["created_by"])
+        user_ids.add(row["assigned_to"])
+    users = await get_users_info(user_ids)
+
+    return {
+        "created": [build_task_response(row, users) for row in created_rows],
+        "updated": [build_task_response(row, users) for row in updated_rows],
+        "deleted": bulk.delete
+    }
+
 @app.put("/tasks/{task_id}")
 async def update_task(task_id: int, task_update: TaskUpdate, current_user_id: int = Depends(verify_token)):
-    with db.get_connection() as conn:
-        existing_task = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
-        if not existing_task:
-            raise HTTPException(status_code=404, detail="Task not found")
-
-        update_fields = []
-        update_values = []
-
-        if task_update.title is not None:
-            update_fields.append("title = ?")
-            update_values.append(task_update.title)
-        if task_update.description is not None:
-            update_fields.append("description = ?")
-            update_values.append(task_update.description)
-        if task_update.status is not None:
-            update_fields.append("status = ?")
-            update_values.append(task_update.status)
-        if task_update.priority is not None:
-            update_fields.append("priority = ?")
-            update_values.append(task_update.priority)
-        if task_update.assigned_to is not None:
-            update_fields.append("assigned_to = ?")
-            update_values.append(task_update.assigned_to)
-        if task_update.due_date is not None:
-            update_fields.append("due_date = ?")
-            update_values.append(task_update.due_date)
-
-        if update_fields:
-            update_fields.append("updated_at = ?")
-            update_values.append(datetime.now().isoformat())
-            update_values.append(task_id)
-
-            conn.execute(
-                f"UPDATE tasks SET {', '.join(update_fields)} WHERE id = ?",
-                update_values
-            )
-            conn.commit()
-
-            updated_task = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    existing_task, updated_task = await db.write(apply_task_update, task_id, task_update)
+    bump_task_versions(existing_task, updated_task)
+    outbox_wakeup.set()
 
-            if task_update.status and task_update.status.lower() != existing_task["status"].lower():
-                if updated_task["assigned_to"]:
-                    status_pt = traduzir_status(task_update.status)
-                    print(f"Enviando notificação: tarefa '{updated_task['title']}', status {status_pt}")
-                    await send_notification(
-                        updated_task["assigned_to"],
-                        "Status da tarefa alterado",
-                        f"A tarefa '{updated_task['title']}' teve seu status alterado para {status_pt}."
-                    )
+    users = await get_users_info([updated_task["created_by"], updated_task["assigned_to"]])
 
-        else:
-            updated_task = existing_task
-
-        created_by_info = await get_user_info(updated_task["created_by"])
-        assigned_user_info = await get_user_info(updated_task["assigned_to"]) if updated_task["assigned_to"] else None
-
-        return {
-            "id": updated_task["id"],
-            "title": updated_task["title"],
-            "description": updated_task["description"],
-            "status": updated_task["status"],
-            "priority": updated_task["priority"],
-            "assigned_to": updated_task["assigned_to"],
-            "assigned_user_name": assigned_user_info["name"] if assigned_user_info else None,
-            "due_date": updated_task["due_date"],
-            "created_at": updated_task["created_at"],
-            "updated_at": updated_task["updated_at"],
-            "created_by": updated_task["created_by"],
-            "created_by_name": created_by_info["name"] if created_by_info else "Unknown"
-        }
+    return build_task_response(updated_task, users)
 
 @app.delete("/tasks/{task_id}")
 async def delete_task(task_id: int, current_user_id: int = Depends(verify_token)):
-    with db.get_connection() as conn:
-        task = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
-        if not task:
-            raise HTTPException(status_code=404, detail="Task not found")
+    deleted_task = await db.write(delete_task_row, task_id)
+    bump_task_versions(deleted_task)
+    return {"message": "Task deleted successfully"}
 
-        conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-        conn.commit()
+def select_task_user_ids(conn):
+    rows = conn.execute("""
+        SELECT created_by AS user_id FROM tasks
+        UNION
+        SELECT assigned_to FROM tasks WHERE assigned_to IS NOT NULL
+    """).fetchall()
+    return [row["user_id"] for row in rows]
 
-        return {"message": "Task deleted successfully"}
+async def backfill_user_names():
+    # Preenche a projeção com todos os usuários referenciados pelas tarefas
+    global http_client
+    http_client = httpx.AsyncClient(timeout=10.0)
+    try:
+        user_ids = await db.read(select_task_user_ids)
+        users = await fetch_users(user_ids)
+        if users_service_degraded():
+            raise SystemExit("users-service indisponível; backfill incompleto")
+        await db.write(upsert_user_names, list(users.values()))
+        print(f"{len(users)} de {len(user_ids)} usuários gravados em user_names")
+    finally:
+        await http_client.aclose()
+        db.close()
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    if sys.argv[1:] == ["backfill-user-names"]:
+        asyncio.run(backfill_user_names())
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
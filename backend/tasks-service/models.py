@@ -22,6 +22,15 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
+class UserBatchRequest(BaseModel):
+    ids: List[int]
+
+class UserEvent(BaseModel):
+    type: str
+    user_id: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+
 class User(UserBase):
     id: int
     created_at: datetime
@@ -47,6 +56,14 @@ class TaskUpdate(BaseModel):
     assigned_to: Optional[int] = None
     due_date: Optional[datetime] = None
 
+class TaskBulkUpdate(TaskUpdate):
+    id: int
+
+class TaskBulkRequest(BaseModel):
+    create: List[TaskCreate] = []
+    update: List[TaskBulkUpdate] = []
+    delete: List[int] = []
+
 class Task(TaskBase):
     id: int
     status: TaskStatus = TaskStatus.PENDING
@@ -65,6 +82,10 @@ class NotificationBase(BaseModel):
 class NotificationCreate(NotificationBase):
     pass
 
+class NotificationReadRequest(BaseModel):
+    ids: List[int] = []
+    up_to_id: Optional[int] = None
+
 class Notification(NotificationBase):
     id: int
     is_read: bool = False
@@ -0,0 +1,155 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_service(service: str, module_name: str, workdir):
+    # Cada serviço importa database/models/cache/auth pelo nome, a partir da própria pasta
+    # (cópias idênticas de shared/). O main.py abre o banco em "data/" relativo ao cwd,
+    # então a importação roda dentro de um diretório temporário
+    service_dir = os.path.join(BACKEND_DIR, service)
+    previous_cwd = os.getcwd()
+    sys.path.insert(0, service_dir)
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    os.chdir(workdir)
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(service_dir, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(previous_cwd)
+        sys.path.remove(service_dir)
+    return module
+
+
+@pytest.fixture(scope="module")
+def tasks_service(tmp_path_factory):
+    return load_service("tasks-service", "tasks_service_main", tmp_path_factory.mktemp("tasks-service"))
+
+
+@pytest.fixture(scope="module")
+def notifications_service(tmp_path_factory):
+    return load_service("notifications-service", "notifications_service_main", tmp_path_factory.mktemp("notifications-service"))
+
+
+@pytest.fixture(scope="module")
+def tasks_db(tasks_service, tmp_path_factory):
+    # Banco novo, com todas as migrações aplicadas, em um caminho absoluto
+    return tasks_service.TasksDatabase(str(tmp_path_factory.mktemp("tasks-db") / "tasks.db"))
+
+
+@pytest.fixture(scope="module")
+def notifications_db(notifications_service, tmp_path_factory):
+    return notifications_service.NotificationsDatabase(str(tmp_path_factory.mktemp("notifications-db") / "notifications.db"))
+
+
+class RecordingConnection:
+    """Repassa as chamadas para a conexão real e guarda cada SQL executado com seus parâmetros."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, params))
+        return self._conn.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def query_plans(conn, fn, *args):
+    # Executa a consulta de verdade e devolve o EXPLAIN QUERY PLAN de cada SQL que ela rodou
+    recording = RecordingConnection(conn)
+    fn(recording, *args)
+    assert recording.statements
+    return [
+        conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        for sql, params in recording.statements
+    ]
+
+
+def plan_details(plan):
+    return [row["detail"] for row in plan]
+
+
+def full_scans(plan, tables):
+    # "SCAN tasks"/"SCAN t" é varredura completa da tabela; "SCAN page"/"SCAN (subquery-N)"
+    # percorre resultados intermediários já limitados e não conta
+    scans = []
+    for detail in plan_details(plan):
+        words = detail.split()
+        if words[0] == "SCAN" and words[1] in tables:
+            scans.append(detail)
+    return scans
+
+
+def unbounded_sorts(plan):
+    # Um TEMP B-TREE só é aceitável sobre algo já limitado, como a saída de uma subconsulta com
+    # LIMIT ("SCAN (subquery-N)"). Ao lado de um MULTI-INDEX OR ou de uma busca direta por
+    # índice secundário, ele ordena todas as linhas visíveis antes do LIMIT
+    children = {}
+    for row in plan:
+        children.setdefault(row["parent"], []).append(row)
+
+    def is_index_access(row):
+        detail = row["detail"]
+        if detail.startswith("MULTI-INDEX OR"):
+            return True
+        return detail.startswith(("SEARCH", "SCAN")) and " INDEX idx_" in detail
+
+    sorts = []
+    for siblings in children.values():
+        for row in siblings:
+            if "TEMP B-TREE" not in row["detail"]:
+                continue
+            if any(is_index_access(sibling) for sibling in siblings if sibling is not row):
+                sorts.append(row["detail"])
+    return sorts
+
+
+TASK_FILTERS = [
+    {},
+    {"status": "pending"},
+    {"status": "in_progress", "priority": "high"},
+    {"assigned_to": 2},
+    {"due_after": "2024-01-01T00:00:00", "due_before": "2024-12-31T23:59:59"},
+]
+
+
+@pytest.mark.parametrize("filters", TASK_FILTERS)
+@pytest.mark.parametrize("with_cursor", [False, True])
+def test_task_list_uses_indexes_without_sorting_everything(tasks_service, tasks_db, filters, with_cursor):
+    cursor = None
+    if with_cursor:
+        cursor = tasks_service.encode_cursor({"created_at": "2024-06-01T12:00:00", "id": 500})
+
+    with tasks_db.get_connection() as conn:
+        plans = query_plans(conn, tasks_service.select_user_tasks, 1, filters, 20, cursor)
+
+    for plan in plans:
+        details = " | ".join(plan_details(plan))
+        # Com filtro por responsável os dois ramos têm igualdade em assigned_to e podem
+        # percorrer o mesmo índice; sem ele cada ramo usa o índice da sua coluna
+        if "assigned_to" not in filters:
+            assert "idx_tasks_created_by_created_at" in details
+        assert "idx_tasks_assigned_to_created_at" in details
+        assert "MULTI-INDEX OR" not in details
+        assert full_scans(plan, {"tasks", "t"}) == [], details
+        assert unbounded_sorts(plan) == [], details
+
+
+@pytest.mark.parametrize("mode", [{}, {"before_id": 1000}, {"since_id": 1000}])
+def test_notification_list_uses_user_index(notifications_service, notifications_db, mode):
+    with notifications_db.get_connection() as conn:
+        plans = query_plans(conn, notifications_service.select_notifications, 1, 50, mode.get("before_id"), mode.get("since_id"))
+
+    for plan in plans:
+        details = " | ".join(plan_details(plan))
+        assert "idx_notifications_user_id" in details
+        assert full_scans(plan, {"notifications", "n"}) == [], details
+        assert "TEMP B-TREE" not in details
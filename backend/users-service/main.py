@@ -1,15 +1,21 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Header, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 import sys
 import os
+import json
+import asyncio
+import httpx
+from concurrent.futures import ProcessPoolExecutor
 
 # Add shared directory to path
 #sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
-from models import User, UserCreate, LoginRequest, Token
+from models import User, UserCreate, LoginRequest, Token, UserBatchRequest
 from database import Database
-from auth import get_password_hash, verify_password, create_access_token, verify_token
+from cache import etag_matches
+from auth import get_password_hash, verify_password, create_access_token, verify_token, sign_service_request, SERVICE_SIGNATURE_HEADER
 from datetime import datetime, timedelta
+from typing import Optional
 import sqlite3
 
 app = FastAPI(title="Users Service")
@@ -24,7 +30,7 @@ app.add_middleware(
 
 class UsersDatabase(Database):
     def init_db(self):
-        with self.get_connection() as conn:
+        with self.get_write_connection() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS users (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -38,105 +44,180 @@ class UsersDatabase(Database):
 
 db = UsersDatabase("data/users.db")
 
+# Serviços que mantêm dados de usuários em cache e precisam saber quando eles mudam
+USER_EVENTS_SUBSCRIBERS = [
+    url.strip()
+    for url in os.getenv("USER_EVENTS_SUBSCRIBERS", "http://tasks-service:8001/events/users").split(",")
+    if url.strip()
+]
+
+# Limite de parâmetros por consulta IN (o SQLite limita o número de variáveis)
+USERS_BATCH_CHUNK_SIZE = 500
+
+# bcrypt roda em processos separados para não travar o event loop; o semáforo limita
+# quantas operações podem estar na fila ao mesmo tempo
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+BCRYPT_MAX_CONCURRENCY = int(os.getenv("BCRYPT_MAX_CONCURRENCY", str(BCRYPT_WORKERS * 2)))
+
+password_executor = None
+password_semaphore = None
+# Hash usado para igualar o tempo de resposta quando o email não existe (calculado uma vez)
+dummy_password_hash = None
+
+async def run_password_task(fn, *args):
+    async with password_semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, fn, *args)
+
+@app.on_event("startup")
+async def start_password_pool():
+    global password_executor, password_semaphore, dummy_password_hash
+    password_executor = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS)
+    password_semaphore = asyncio.Semaphore(BCRYPT_MAX_CONCURRENCY)
+    dummy_password_hash = await run_password_task(get_password_hash, "fake_password")
+
+@app.on_event("shutdown")
+async def stop_password_pool():
+    password_executor.shutdown(wait=False, cancel_futures=True)
+
+async def publish_user_event(event_type: str, user: dict):
+    event = {"type": event_type, "user_id": user["id"], "name": user["name"], "email": user["email"]}
+    body = json.dumps(event).encode()
+    headers = {"Content-Type": "application/json", SERVICE_SIGNATURE_HEADER: sign_service_request(body)}
+    async with httpx.AsyncClient() as client:
+        for url in USER_EVENTS_SUBSCRIBERS:
+            try:
+                response = await client.post(url, content=body, headers=headers, timeout=5.0)
+            except httpx.HTTPError:
+                continue
+            if response.status_code != 200:
+                print(f"Evento de usuário recusado por {url}: {response.status_code}")
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "users-service"}
 
+def user_to_dict(row):
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "email": row["email"],
+        "created_at": row["created_at"]
+    }
+
+def insert_user(conn, name: str, email: str, password_hash: str):
+    cursor = conn.execute(
+        "INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)",
+        (name, email, password_hash)
+    )
+    return cursor.lastrowid
+
+def select_user_by_email(conn, email: str):
+    return conn.execute(
+        "SELECT id, name, email, password_hash FROM users WHERE email = ?",
+        (email,)
+    ).fetchone()
+
+def select_users(conn):
+    users_rows = conn.execute(
+        "SELECT id, name, email, created_at FROM users ORDER BY name"
+    ).fetchall()
+    return [user_to_dict(row) for row in users_rows]
+
+def select_users_by_ids(conn, user_ids):
+    users = []
+    for start in range(0, len(user_ids), USERS_BATCH_CHUNK_SIZE):
+        chunk = user_ids[start:start + USERS_BATCH_CHUNK_SIZE]
+        placeholders = ", ".join("?" for _ in chunk)
+        users_rows = conn.execute(
+            f"SELECT id, name, email, created_at FROM users WHERE id IN ({placeholders})",
+            chunk
+        ).fetchall()
+        users.extend(user_to_dict(row) for row in users_rows)
+    return users
+
+def select_user(conn, user_id: int):
+    return conn.execute(
+        "SELECT id, name, email, created_at FROM users WHERE id = ?",
+        (user_id,)
+    ).fetchone()
+
 @app.post("/users/register")
-async def register_user(user: UserCreate):
-    hashed_password = get_password_hash(user.password)
-    
-    with db.get_connection() as conn:
-        try:
-            cursor = conn.execute(
-                "INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)",
-                (user.name, user.email, hashed_password)
-            )
-            conn.commit()
-            
-            user_id = cursor.lastrowid
-            return {"id": user_id, "name": user.name, "email": user.email, "message": "User created successfully"}
-            
-        except sqlite3.IntegrityError:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
+async def register_user(user: UserCreate, background_tasks: BackgroundTasks):
+    hashed_password = await run_password_task(get_password_hash, user.password)
+
+    try:
+        user_id = await db.write(insert_user, user.name, user.email, hashed_password)
+    except sqlite3.IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+
+    background_tasks.add_task(
+        publish_user_event, "user.created", {"id": user_id, "name": user.name, "email": user.email}
+    )
+    return {"id": user_id, "name": user.name, "email": user.email, "message": "User created successfully"}
 
 @app.post("/users/login")
 async def login_user(login_data: LoginRequest):
-    with db.get_connection() as conn:
-        user_row = conn.execute(
-            "SELECT id, name, email, password_hash FROM users WHERE email = ?",
-            (login_data.email,)
-        ).fetchone()
+    user_row = await db.read(select_user_by_email, login_data.email)
 
+    if not user_row:
         # Usar senha dummy para evitar ataque de tempo (proteção adicional)
-        fake_hash = get_password_hash("fake_password")
-
-        if not user_row:
-            verify_password("fake_password", fake_hash)  # Dummy verification
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Email ou senha incorretos"
-            )
-
-        if not verify_password(login_data.password, user_row["password_hash"]):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Email ou senha incorretos"
-            )
-
-        access_token_expires = timedelta(minutes=30)
-        access_token = create_access_token(
-            data={"sub": str(user_row["id"])}, expires_delta=access_token_expires
+        await run_password_task(verify_password, login_data.password, dummy_password_hash)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Email ou senha incorretos"
+        )
+
+    if not await run_password_task(verify_password, login_data.password, user_row["password_hash"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Email ou senha incorretos"
         )
 
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user": {
-                "id": user_row["id"],
-                "name": user_row["name"],
-                "email": user_row["email"]
-            }
+    access_token_expires = timedelta(minutes=30)
+    access_token = create_access_token(
+        data={"sub": str(user_row["id"])}, expires_delta=access_token_expires
+    )
+
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user": {
+            "id": user_row["id"],
+            "name": user_row["name"],
+            "email": user_row["email"]
         }
+    }
 
 @app.get("/users")
-async def get_users(current_user_id: int = Depends(verify_token)):
-    with db.get_connection() as conn:
-        users_rows = conn.execute(
-            "SELECT id, name, email, created_at FROM users ORDER BY name"
-        ).fetchall()
-        
-        users = []
-        for row in users_rows:
-            users.append({
-                "id": row["id"],
-                "name": row["name"],
-                "email": row["email"],
-                "created_at": row["created_at"]
-            })
-        
-        return users
+async def get_users(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user_id: int = Depends(verify_token)
+):
+    # A lista é a mesma para todos os usuários, então o ETag depende só da versão do banco
+    etag = db.etag("users")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    return await db.read(select_users)
+
+@app.post("/users/batch")
+async def get_users_batch(batch: UserBatchRequest):
+    # Busca vários usuários de uma vez (usado pelos outros serviços para evitar N+1)
+    return await db.read(select_users_by_ids, list(dict.fromkeys(batch.ids)))
 
 @app.get("/users/{user_id}")
 async def get_user(user_id: int):
-    with db.get_connection() as conn:
-        user_row = conn.execute(
-            "SELECT id, name, email, created_at FROM users WHERE id = ?",
-            (user_id,)
-        ).fetchone()
-        
-        if not user_row:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        return {
-            "id": user_row["id"],
-            "name": user_row["name"],
-            "email": user_row["email"],
-            "created_at": user_row["created_at"]
-        }
+    user_row = await db.read(select_user, user_id)
+    if not user_row:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return user_to_dict(user_row)
 
 if __name__ == "__main__":
     import uvicorn
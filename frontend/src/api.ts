@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { User, Task, TaskCreate, TaskUpdate, Notification } from './types';
+import { User, Task, TaskCreate, TaskUpdate, TaskQuery, TaskSearchQuery, TaskPage, TaskStats, Notification, NotificationQuery, NotificationReadQuery } from './types';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
@@ -16,6 +16,36 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// Respostas de GET guardadas junto com o ETag: a próxima busca envia If-None-Match e,
+// se o servidor responder 304 Not Modified, reaproveita o corpo e os cabeçalhos guardados
+const MAX_CACHED_RESPONSES = 50;
+const responseCache = new Map<string, { etag: string; data: any; headers: Record<string, any> }>();
+
+const conditionalGet = async (url: string, params?: object) => {
+  const key = `${localStorage.getItem('token') ?? ''} ${url} ${JSON.stringify(params ?? {})}`;
+  const cached = responseCache.get(key);
+  const response = await api.get(url, {
+    params,
+    headers: cached ? { 'If-None-Match': cached.etag } : undefined,
+    validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+  });
+
+  if (response.status === 304 && cached) {
+    return cached;
+  }
+
+  const etag = response.headers['etag'];
+  responseCache.delete(key);
+  if (etag) {
+    responseCache.set(key, { etag, data: response.data, headers: { ...response.headers } });
+    if (responseCache.size > MAX_CACHED_RESPONSES) {
+      // Map preserva a ordem de inserção: a primeira chave é a mais antiga
+      responseCache.delete(responseCache.keys().next().value as string);
+    }
+  }
+  return { data: response.data, headers: response.headers };
+};
+
 // Auth APIs
 export const register = async (name: string, email: string, password: string) => {
   const response = await api.post('/users/register', { name, email, password });
@@ -29,16 +59,34 @@ export const login = async (email: string, password: string) => {
 
 // User APIs
 export const getUsers = async (): Promise<User[]> => {
-  const response = await api.get('/users');
+  const response = await conditionalGet('/users');
   return response.data;
 };
 
 // Task APIs
-export const getTasks = async (): Promise<Task[]> => {
-  const response = await api.get('/tasks');
+export const getTasks = async (query: TaskQuery = {}): Promise<TaskPage> => {
+  const response = await conditionalGet('/tasks', query);
+  return {
+    items: response.data,
+    nextCursor: response.headers['x-next-cursor'] ?? null
+  };
+};
+
+// Contagens do dashboard calculadas no servidor
+export const getTaskStats = async (): Promise<TaskStats> => {
+  const response = await api.get('/tasks/stats');
   return response.data;
 };
 
+// Busca textual no servidor, ordenada por relevância
+export const searchTasks = async (query: TaskSearchQuery): Promise<TaskPage> => {
+  const response = await conditionalGet('/tasks/search', query);
+  return {
+    items: response.data,
+    nextCursor: response.headers['x-next-cursor'] ?? null
+  };
+};
+
 export const createTask = async (task: TaskCreate): Promise<Task> => {
   const response = await api.post('/tasks', task);
   return response.data;
@@ -54,11 +102,89 @@ export const deleteTask = async (id: number): Promise<void> => {
 };
 
 // Notification APIs
-export const getNotifications = async (): Promise<Notification[]> => {
-  const response = await api.get('/notifications');
+export const getNotifications = async (query: NotificationQuery = {}): Promise<Notification[]> => {
+  const response = await conditionalGet('/notifications', query);
   return response.data;
 };
 
-export const markNotificationAsRead = async (id: number): Promise<void> => {
-  await api.put(`/notifications/${id}/read`);
-};
\ No newline at end of file
+export const getUnreadCount = async (): Promise<number> => {
+  const response = await api.get('/notifications/unread-count');
+  return response.data.unread_count;
+};
+
+// Marca várias notificações de uma vez (por ids ou todas até up_to_id) e retorna o novo
+// total de não lidas
+export const markNotificationsAsRead = async (query: NotificationReadQuery): Promise<number> => {
+  const response = await api.put('/notifications/read', query);
+  return response.data.unread_count;
+};
+
+export const markNotificationAsRead = async (id: number): Promise<number> => {
+  return markNotificationsAsRead({ ids: [id] });
+};
+
+// Push de notificações em tempo real (Server-Sent Events). EventSource não envia
+// cabeçalhos, então cada conexão usa um ticket de uso único (obtido com o JWT) na query
+// string; ao cair, a conexão é refeita com um ticket novo e o cliente ressincroniza.
+// onConnectionChange informa quando a conexão abre ou cai, para o chamador usar polling só
+// enquanto ela estiver fora. Retorna a função que fecha a conexão.
+const STREAM_RETRY_MS = 5000;
+
+export const subscribeToNotifications = (
+  onNotification: (notification: Notification) => void,
+  onResync: () => void,
+  onConnectionChange?: (connected: boolean) => void
+): (() => void) => {
+  let source: EventSource | null = null;
+  let retryTimer: ReturnType<typeof setTimeout> | undefined;
+  let closed = false;
+  let connectedBefore = false;
+
+  const scheduleReconnect = () => {
+    if (!closed) {
+      retryTimer = setTimeout(connect, STREAM_RETRY_MS);
+    }
+  };
+
+  const connect = async () => {
+    let ticket: string;
+    try {
+      const response = await api.post('/notifications/stream-ticket');
+      ticket = response.data.ticket;
+    } catch (error) {
+      scheduleReconnect();
+      return;
+    }
+    if (closed) return;
+
+    const stream = new EventSource(
+      `${API_BASE_URL}/api/notifications/stream?ticket=${encodeURIComponent(ticket)}`
+    );
+    source = stream;
+
+    stream.addEventListener('open', () => {
+      // Notificações criadas enquanto a conexão estava caída são buscadas de novo
+      if (connectedBefore) onResync();
+      connectedBefore = true;
+      onConnectionChange?.(true);
+    });
+    stream.addEventListener('notification', (event) => {
+      onNotification(JSON.parse((event as MessageEvent).data));
+    });
+    stream.addEventListener('resync', () => onResync());
+    stream.onerror = () => {
+      // O ticket já foi consumido, então a reconexão automática do EventSource falharia
+      stream.close();
+      onConnectionChange?.(false);
+      scheduleReconnect();
+    };
+  };
+
+  connect();
+
+  return () => {
+    closed = true;
+    clearTimeout(retryTimer);
+    source?.close();
+  };
+};
@@ -6,9 +6,10 @@ interface HeaderProps {
   user: User;
   onLogout: () => void;
   onShowNotifications: () => void;
+  unreadCount?: number;
 }
 
-const Header: React.FC<HeaderProps> = ({ user, onLogout, onShowNotifications }) => {
+const Header: React.FC<HeaderProps> = ({ user, onLogout, onShowNotifications, unreadCount = 0 }) => {
   return (
     <header className="bg-white shadow-sm border-b border-gray-200">
       <div className="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8">
@@ -28,10 +29,15 @@ const Header: React.FC<HeaderProps> = ({ user, onLogout, onShowNotifications })
           <div className="flex items-center space-x-4">
             <button
               onClick={onShowNotifications}
-              className="p-2 text-gray-400 hover:text-gray-600 hover:bg-gray-100 rounded-lg transition-colors"
+              className="relative p-2 text-gray-400 hover:text-gray-600 hover:bg-gray-100 rounded-lg transition-colors"
               aria-label="Notificações"
             >
               <Bell className="h-6 w-6" />
+              {unreadCount > 0 && (
+                <span className="absolute -top-1 -right-1 bg-red-600 text-white rounded-full text-xs min-w-[1.25rem] h-5 px-1 flex items-center justify-center font-bold">
+                  {unreadCount > 99 ? '99+' : unreadCount}
+                </span>
+              )}
             </button>
 
             <div className="flex items-center space-x-3">
@@ -1,7 +1,7 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { Notification } from '../types';
-import { getNotifications, markNotificationAsRead } from '../api';
-import { X, Bell, Check } from 'lucide-react';
+import { markNotificationAsRead, markNotificationsAsRead } from '../api';
+import { X, Bell, Check, CheckCheck } from 'lucide-react';
 
 import dayjs from 'dayjs';
 import relativeTime from 'dayjs/plugin/relativeTime';
@@ -14,48 +14,58 @@ dayjs.extend(utc);
 dayjs.extend(timezone);
 dayjs.locale('pt-br');
 
+// A lista e a conexão em tempo real ficam no TaskDashboard; o painel só exibe e marca como lidas
 interface NotificationPanelProps {
+  notifications: Notification[];
+  loading: boolean;
+  onNotificationsChange: React.Dispatch<React.SetStateAction<Notification[]>>;
   onClose: () => void;
+  unreadCount: number;
+  onUnreadCountChange: (count?: number) => void;
 }
 
-const NotificationPanel: React.FC<NotificationPanelProps> = ({ onClose }) => {
-  const [notifications, setNotifications] = useState<Notification[]>([]);
-  const [loading, setLoading] = useState(true);
-
-  useEffect(() => {
-    loadNotifications();
-  }, []);
-
-  const loadNotifications = async () => {
-    try {
-      const data = await getNotifications();
-      setNotifications(data);
-    } catch (error) {
-      console.error('Error loading notifications:', error);
-    } finally {
-      setLoading(false);
-    }
-  };
-
+const NotificationPanel: React.FC<NotificationPanelProps> = ({
+  notifications,
+  loading,
+  onNotificationsChange,
+  onClose,
+  unreadCount,
+  onUnreadCountChange
+}) => {
   const handleMarkAsRead = async (notificationId: number) => {
     try {
-      await markNotificationAsRead(notificationId);
-      setNotifications(prev =>
+      const count = await markNotificationAsRead(notificationId);
+      onNotificationsChange(prev =>
         prev.map(notif =>
           notif.id === notificationId ? { ...notif, is_read: true } : notif
         )
       );
+      onUnreadCountChange(count);
     } catch (error) {
       console.error('Error marking notification as read:', error);
     }
   };
 
+  // Marca tudo até a notificação mais recente exibida; as que chegarem depois continuam não lidas
+  const handleMarkAllAsRead = async () => {
+    const latestId = notifications.reduce((max, notif) => Math.max(max, notif.id), 0);
+    if (latestId === 0) return;
+
+    try {
+      const count = await markNotificationsAsRead({ up_to_id: latestId });
+      onNotificationsChange(prev =>
+        prev.map(notif => (notif.id <= latestId ? { ...notif, is_read: true } : notif))
+      );
+      onUnreadCountChange(count);
+    } catch (error) {
+      console.error('Error marking all notifications as read:', error);
+    }
+  };
+
   const formatDate = (dateString: string) => {
     return dayjs.utc(dateString).tz(dayjs.tz.guess()).fromNow();
   };
 
-  const unreadCount = notifications.filter(n => !n.is_read).length;
-
   return (
     <div className="fixed inset-0 bg-black bg-opacity-50 flex items-start justify-end p-4 z-50">
       <div className="bg-white rounded-2xl shadow-xl max-w-md w-full max-h-[80vh] overflow-hidden mt-16">
@@ -81,7 +91,16 @@ const NotificationPanel: React.FC<NotificationPanelProps> = ({ onClose }) => {
 
         <div className="p-2 text-sm text-gray-600 border-b border-gray-200">
           {unreadCount > 0 ? (
-            <span>Você tem <strong>{unreadCount}</strong> notificações não lidas</span>
+            <div className="flex items-center justify-between">
+              <span>Você tem <strong>{unreadCount}</strong> notificações não lidas</span>
+              <button
+                onClick={handleMarkAllAsRead}
+                className="inline-flex items-center text-blue-600 hover:text-blue-800 transition-colors"
+              >
+                <CheckCheck className="h-4 w-4 mr-1" />
+                Marcar todas como lidas
+              </button>
+            </div>
           ) : (
             <span>Você não tem notificações não lidas</span>
           )}
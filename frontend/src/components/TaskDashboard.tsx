@@ -1,37 +1,152 @@
-import React, { useState, useEffect } from 'react';
-import { User, Task } from '../types';
+import React, { useState, useEffect, useRef } from 'react';
+import { User, Task, TaskStats, Notification } from '../types';
 import Header from './Header';
 import TaskList from './TaskList';
 import TaskForm from './TaskForm';
 import NotificationPanel from './NotificationPanel';
-import { getTasks, getUsers } from '../api';
-import { Plus } from 'lucide-react';
+import { getNotifications, getTasks, getTaskStats, getUnreadCount, getUsers, searchTasks, subscribeToNotifications } from '../api';
+import { Plus, Search } from 'lucide-react';
 
 interface TaskDashboardProps {
   user: User;
   onLogout: () => void;
 }
 
+// Polling do contador só enquanto o canal de notificações em tempo real estiver fora
+const UNREAD_POLL_INTERVAL_MS = 30000;
+
 const TaskDashboard: React.FC<TaskDashboardProps> = ({ user, onLogout }) => {
   const [tasks, setTasks] = useState<Task[]>([]);
   const [users, setUsers] = useState<User[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [stats, setStats] = useState<TaskStats | null>(null);
+  const [unreadCount, setUnreadCount] = useState(0);
+  const [notifications, setNotifications] = useState<Notification[]>([]);
+  const [notificationsLoading, setNotificationsLoading] = useState(true);
+  const [streamConnected, setStreamConnected] = useState(false);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [showTaskForm, setShowTaskForm] = useState(false);
   const [showNotifications, setShowNotifications] = useState(false);
   const [editingTask, setEditingTask] = useState<Task | null>(null);
+  const notificationsRef = useRef<Notification[]>([]);
+  notificationsRef.current = notifications;
 
   useEffect(() => {
     loadData();
   }, []);
 
+  // Uma única conexão em tempo real para o dashboard inteiro: mantém o badge e a lista de
+  // notificações atualizados mesmo com o painel fechado
+  useEffect(() => {
+    refreshUnreadCount();
+    loadNotifications();
+
+    return subscribeToNotifications(
+      notification => {
+        if (!notificationsRef.current.some(notif => notif.id === notification.id)) {
+          setUnreadCount(prev => prev + 1);
+        }
+        mergeNotifications([notification]);
+      },
+      () => {
+        resyncNotifications();
+        refreshUnreadCount();
+      },
+      setStreamConnected
+    );
+  }, []);
+
+  // Badge de não lidas: leitura barata do contador materializado no servidor
+  useEffect(() => {
+    if (streamConnected) return;
+
+    const interval = setInterval(refreshUnreadCount, UNREAD_POLL_INTERVAL_MS);
+    return () => clearInterval(interval);
+  }, [streamConnected]);
+
+  const mergeNotifications = (incoming: Notification[]) => {
+    setNotifications(prev => {
+      const knownIds = new Set(prev.map(notif => notif.id));
+      const fresh = incoming.filter(notif => !knownIds.has(notif.id));
+      return fresh.length > 0 ? [...fresh, ...prev].sort((a, b) => b.id - a.id) : prev;
+    });
+  };
+
+  const loadNotifications = async () => {
+    try {
+      mergeNotifications(await getNotifications());
+    } catch (error) {
+      console.error('Error loading notifications:', error);
+    } finally {
+      setNotificationsLoading(false);
+    }
+  };
+
+  // Busca o que chegou enquanto a conexão estava caída ou a fila do servidor transbordou
+  const resyncNotifications = async () => {
+    const latestId = notificationsRef.current.reduce((max, notif) => Math.max(max, notif.id), 0);
+    if (latestId === 0) {
+      await loadNotifications();
+      return;
+    }
+
+    try {
+      mergeNotifications(await getNotifications({ since_id: latestId }));
+    } catch (error) {
+      console.error('Error resyncing notifications:', error);
+    }
+  };
+
+  const updateUnreadCount = (count?: number) => {
+    if (count === undefined) {
+      refreshUnreadCount();
+    } else {
+      setUnreadCount(count);
+    }
+  };
+
+  const refreshUnreadCount = async () => {
+    try {
+      setUnreadCount(await getUnreadCount());
+    } catch (error) {
+      console.error('Error loading unread count:', error);
+    }
+  };
+
+  // Busca no servidor com debounce; com o campo vazio volta para a listagem normal
+  useEffect(() => {
+    if (loading) return;
+
+    const timeout = setTimeout(async () => {
+      try {
+        const tasksPage = await fetchTasksPage();
+        setTasks(tasksPage.items);
+        setNextCursor(tasksPage.nextCursor);
+      } catch (error) {
+        console.error('Error searching tasks:', error);
+      }
+    }, 300);
+    return () => clearTimeout(timeout);
+  }, [searchQuery]);
+
+  const fetchTasksPage = (cursor?: string) => {
+    const q = searchQuery.trim();
+    return q ? searchTasks({ q, cursor }) : getTasks({ cursor });
+  };
+
   const loadData = async () => {
     try {
-      const [tasksData, usersData] = await Promise.all([
+      const [tasksPage, usersData, statsData] = await Promise.all([
         getTasks(),
-        getUsers()
+        getUsers(),
+        getTaskStats()
       ]);
-      setTasks(tasksData);
+      setTasks(tasksPage.items);
+      setNextCursor(tasksPage.nextCursor);
       setUsers(usersData);
+      setStats(statsData);
     } catch (error) {
       console.error('Error loading data:', error);
     } finally {
@@ -39,9 +154,34 @@ const TaskDashboard: React.FC<TaskDashboardProps> = ({ user, onLogout }) => {
     }
   };
 
+  const loadMoreTasks = async () => {
+    if (!nextCursor) return;
+
+    setLoadingMore(true);
+    try {
+      const tasksPage = await fetchTasksPage(nextCursor);
+      setTasks(prev => [...prev, ...tasksPage.items]);
+      setNextCursor(tasksPage.nextCursor);
+    } catch (error) {
+      console.error('Error loading more tasks:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // As contagens vêm do servidor, então são recarregadas depois de cada alteração
+  const refreshStats = async () => {
+    try {
+      setStats(await getTaskStats());
+    } catch (error) {
+      console.error('Error loading task stats:', error);
+    }
+  };
+
   const handleTaskCreated = (newTask: Task) => {
     setTasks(prev => [newTask, ...prev]);
     setShowTaskForm(false);
+    refreshStats();
   };
 
   const handleTaskUpdated = (updatedTask: Task) => {
@@ -49,10 +189,12 @@ const TaskDashboard: React.FC<TaskDashboardProps> = ({ user, onLogout }) => {
       task.id === updatedTask.id ? updatedTask : task
     ));
     setEditingTask(null);
+    refreshStats();
   };
 
   const handleTaskDeleted = (taskId: number) => {
     setTasks(prev => prev.filter(task => task.id !== taskId));
+    refreshStats();
   };
 
   const handleEditTask = (task: Task) => {
@@ -79,6 +221,7 @@ const TaskDashboard: React.FC<TaskDashboardProps> = ({ user, onLogout }) => {
         user={user} 
         onLogout={onLogout}
         onShowNotifications={() => setShowNotifications(true)}
+        unreadCount={unreadCount}
       />
       
       <main className="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8 py-8">
@@ -86,6 +229,11 @@ const TaskDashboard: React.FC<TaskDashboardProps> = ({ user, onLogout }) => {
           <div>
             <h1 className="text-3xl font-bold text-gray-900">Minhas Tarefas</h1>
             <p className="mt-2 text-gray-600">Gerencie suas tarefas e colabore com sua equipe</p>
+            {stats && (
+              <p className="mt-1 text-sm text-gray-500">
+                {stats.total} tarefa(s) · <span className="text-red-600">{stats.overdue} atrasada(s)</span> · {stats.due_soon} vencendo em breve
+              </p>
+            )}
           </div>
           <button
             onClick={() => setShowTaskForm(true)}
@@ -96,14 +244,38 @@ const TaskDashboard: React.FC<TaskDashboardProps> = ({ user, onLogout }) => {
           </button>
         </div>
 
+        <div className="relative mb-6">
+          <Search className="absolute left-3 top-1/2 -translate-y-1/2 h-5 w-5 text-gray-400" />
+          <input
+            type="search"
+            value={searchQuery}
+            onChange={(e) => setSearchQuery(e.target.value)}
+            placeholder="Buscar tarefas por título ou descrição..."
+            className="w-full pl-10 pr-4 py-2 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500"
+          />
+        </div>
+
         <TaskList
           tasks={tasks}
           users={users}
           currentUser={user}
+          stats={searchQuery.trim() ? null : stats}
           onEdit={handleEditTask}
           onDelete={handleTaskDeleted}
           onUpdate={handleTaskUpdated}
         />
+
+        {nextCursor && (
+          <div className="mt-8 text-center">
+            <button
+              onClick={loadMoreTasks}
+              disabled={loadingMore}
+              className="inline-flex items-center px-4 py-2 bg-white border border-gray-300 text-gray-700 font-medium rounded-lg hover:bg-gray-50 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-blue-500 transition-colors disabled:opacity-50"
+            >
+              {loadingMore ? 'Carregando...' : 'Carregar mais tarefas'}
+            </button>
+          </div>
+        )}
       </main>
 
       {showTaskForm && (
@@ -118,7 +290,12 @@ const TaskDashboard: React.FC<TaskDashboardProps> = ({ user, onLogout }) => {
 
       {showNotifications && (
         <NotificationPanel
+          notifications={notifications}
+          loading={notificationsLoading}
+          onNotificationsChange={setNotifications}
           onClose={() => setShowNotifications(false)}
+          unreadCount={unreadCount}
+          onUnreadCountChange={updateUnreadCount}
         />
       )}
     </div>
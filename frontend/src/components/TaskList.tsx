@@ -1,11 +1,12 @@
 import React from 'react';
-import { Task, User } from '../types';
+import { Task, TaskStats, User } from '../types';
 import TaskCard from './TaskCard';
 
 interface TaskListProps {
   tasks: Task[];
   users: User[];
   currentUser: User;
+  stats?: TaskStats | null;
   onEdit: (task: Task) => void;
   onDelete: (taskId: number) => void;
   onUpdate: (task: Task) => void;
@@ -15,6 +16,7 @@ const TaskList: React.FC<TaskListProps> = ({
   tasks, 
   users, 
   currentUser, 
+  stats,
   onEdit, 
   onDelete, 
   onUpdate 
@@ -61,7 +63,7 @@ const TaskList: React.FC<TaskListProps> = ({
               {statusLabels[status as keyof typeof statusLabels]}
             </h3>
             <span className="bg-white px-2 py-1 rounded-full text-sm font-medium text-gray-600">
-              {statusTasks.length}
+              {stats ? stats.by_status[status as keyof TaskStats['by_status']] : statusTasks.length}
             </span>
           </div>
           
@@ -36,6 +36,35 @@ export interface TaskUpdate {
   due_date?: string;
 }
 
+export interface TaskQuery {
+  limit?: number;
+  cursor?: string;
+  status?: Task['status'];
+  priority?: Task['priority'];
+  assigned_to?: number;
+  due_after?: string;
+  due_before?: string;
+}
+
+export interface TaskSearchQuery {
+  q: string;
+  limit?: number;
+  cursor?: string;
+}
+
+export interface TaskStats {
+  total: number;
+  by_status: Record<Task['status'], number>;
+  by_priority: Record<Task['priority'], number>;
+  overdue: number;
+  due_soon: number;
+}
+
+export interface TaskPage {
+  items: Task[];
+  nextCursor: string | null;
+}
+
 export interface Notification {
   id: number;
   title: string;
@@ -43,4 +72,15 @@ export interface Notification {
   user_id: number;
   is_read: boolean;
   created_at: string;
+}
+
+export interface NotificationReadQuery {
+  ids?: number[];
+  up_to_id?: number;
+}
+
+export interface NotificationQuery {
+  limit?: number;
+  before_id?: number;
+  since_id?: number;
 }
\ No newline at end of file